@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Encodes positions into feature planes of 9x9 NumPy arrays, for example as
+# the input of a neural network. This module requires NumPy.
+#
+# The planes of a position are, in this order:
+# - For each color and piece type, the squares occupied by such pieces.
+# - For each color and piece type in hand, the number of such pieces.
+# - The side to move (0 for black, 1 for white).
+# - Optionally, for each color, the squares attacked by its pieces.
+# Rows are ranks from "a" and columns are files from 9, like the squares.
+#
+# SFEN strings can also be decoded in bulk into arrays without creating
+# boards, see decode_sfens().
+
+import collections
+import itertools
+import multiprocessing
+
+import numpy
+
+import shogi
+
+PIECE_PLANES = len(shogi.COLORS) * len(shogi.PIECE_TYPES)
+HAND_PLANES = len(shogi.COLORS) * len(shogi.HAND_PIECE_TYPES)
+TURN_PLANE = PIECE_PLANES + HAND_PLANES
+ATTACK_PLANES = len(shogi.COLORS)
+FEATURE_PLANES = TURN_PLANE + 1
+
+# Bitboards are unpacked from this many little endian bytes.
+BITBOARD_BYTES = 11
+
+
+def feature_planes(attacks=False):
+    """Gets the number of feature planes."""
+    return FEATURE_PLANES + ATTACK_PLANES if attacks else FEATURE_PLANES
+
+
+def bitboard_planes(bitboards):
+    """
+    Unpacks bitboards into an array of 0 and 1 of shape (len(bitboards), 9, 9)
+    at once.
+    """
+    data = numpy.frombuffer(b"".join(bb.to_bytes(BITBOARD_BYTES, "little") for bb in bitboards), dtype=numpy.uint8)
+    bits = numpy.unpackbits(data.reshape(-1, BITBOARD_BYTES), axis=1, bitorder="little")
+    return bits[:, :81].reshape(-1, 9, 9)
+
+
+def attack_mask(board, color):
+    """Gets a mask of the squares attacked by the pieces of the given side."""
+    attacks = shogi.BB_VOID
+    for piece_type in shogi.PIECE_TYPES:
+        for square in shogi.scan_forward(board.piece_bb[piece_type] & board.occupied[color]):
+            attacks |= shogi.Board.attacks_from(piece_type, square, board.occupied, color)
+    return attacks
+
+
+def position_bitboards(board, attacks=False):
+    """Gets the bitboards of the occupancy planes of a position."""
+    bitboards = [
+        board.piece_bb[piece_type] & board.occupied[color] for color in shogi.COLORS for piece_type in shogi.PIECE_TYPES
+    ]
+    if attacks:
+        bitboards.extend(attack_mask(board, color) for color in shogi.COLORS)
+    return bitboards
+
+
+def hand_counts(board):
+    """Gets the numbers of pieces in hand in the order of the hand planes."""
+    return [board.pieces_in_hand[color][piece_type] for color in shogi.COLORS for piece_type in shogi.HAND_PIECE_TYPES]
+
+
+def write_features(board, out, attacks=False):
+    """
+    Writes the feature planes of a board into `out`, an array of shape
+    (feature_planes(attacks), 9, 9), and returns it.
+    """
+    planes = bitboard_planes(position_bitboards(board, attacks))
+    out[:PIECE_PLANES] = planes[:PIECE_PLANES]
+    out[PIECE_PLANES:TURN_PLANE] = numpy.array(hand_counts(board))[:, None, None]
+    out[TURN_PLANE] = board.turn
+    if attacks:
+        out[FEATURE_PLANES:] = planes[PIECE_PLANES:]
+    return out
+
+
+def features(board, attacks=False, dtype=numpy.float32):
+    """Gets the feature planes of a board as a new array."""
+    return write_features(board, numpy.empty((feature_planes(attacks), 9, 9), dtype=dtype), attacks)
+
+
+def write_batch_features(boards, out=None, attacks=False, dtype=numpy.float32):
+    """
+    Writes the feature planes of boards or SFEN strings into `out`, an array
+    of shape (len(boards), feature_planes(attacks), 9, 9), and returns it.
+    A new array is allocated if `out` is not given.
+    """
+    boards = list(boards)
+    planes = feature_planes(attacks)
+    if out is None:
+        out = numpy.empty((len(boards), planes, 9, 9), dtype=dtype)
+
+    bitboards = []
+    counts = []
+    turns = []
+    sfen_board = None
+    for board in boards:
+        if not isinstance(board, shogi.Board):
+            if sfen_board is None:
+                sfen_board = shogi.Board(board)
+            else:
+                sfen_board.set_sfen(board)
+            board = sfen_board
+        bitboards.extend(position_bitboards(board, attacks))
+        counts.append(hand_counts(board))
+        turns.append(board.turn)
+
+    bitboard_count = PIECE_PLANES + (ATTACK_PLANES if attacks else 0)
+    unpacked = bitboard_planes(bitboards).reshape(len(boards), bitboard_count, 9, 9)
+    out[:, :PIECE_PLANES] = unpacked[:, :PIECE_PLANES]
+    out[:, PIECE_PLANES:TURN_PLANE] = numpy.array(counts).reshape(len(boards), HAND_PLANES, 1, 1)
+    out[:, TURN_PLANE] = numpy.array(turns)[:, None, None]
+    if attacks:
+        out[:, FEATURE_PLANES:] = unpacked[:, PIECE_PLANES:]
+    return out
+
+
+# Codes of the squares in the arrays of decode_sfens(): 0 for an empty square,
+# otherwise the index of the piece plane of the piece + 1.
+SFEN_PIECE_CODES = {}
+# Indices of the pieces in hand in the arrays of decode_sfens(), in the order
+# of the hand planes.
+SFEN_HAND_INDICES = {}
+
+for color in shogi.COLORS:
+    for piece_type in shogi.PIECE_TYPES:
+        symbol = shogi.Piece(piece_type, color).symbol()
+        SFEN_PIECE_CODES[symbol] = color * len(shogi.PIECE_TYPES) + piece_type
+    for i, piece_type in enumerate(shogi.HAND_PIECE_TYPES):
+        symbol = shogi.Piece(piece_type, color).symbol()
+        SFEN_HAND_INDICES[symbol] = color * len(shogi.HAND_PIECE_TYPES) + i
+
+# Rows and hands repeat a lot across positions, so their decodings are cached.
+SFEN_CACHE_SIZE = 1 << 16
+sfen_row_cache = {}
+sfen_hand_cache = {}
+
+DecodedSfens = collections.namedtuple("DecodedSfens", ["pieces", "hands", "turns", "move_numbers"])
+
+
+def decode_sfen_row(row):
+    """Decodes a row of the position part of a SFEN into 9 square codes."""
+    squares = bytearray()
+    previous_was_digit = False
+    i = 0
+    while i < len(row):
+        c = row[i]
+        if c in "123456789":
+            if previous_was_digit:
+                raise ValueError("two subsequent digits in position part of sfen: {0}".format(repr(row)))
+            squares.extend(bytes(int(c)))
+            previous_was_digit = True
+        else:
+            if c == "+":
+                i += 1
+                c = row[i - 1 : i + 1]
+            code = SFEN_PIECE_CODES.get(c)
+            if code is None:
+                raise ValueError("invalid piece in position part of sfen: {0}".format(repr(row)))
+            squares.append(code)
+            previous_was_digit = False
+        i += 1
+
+    if len(squares) != 9:
+        raise ValueError("expected 9 columns per row in position part of sfen: {0}".format(repr(row)))
+    return bytes(squares)
+
+
+def decode_sfen_hand(hand):
+    """Decodes the pieces in hand part of a SFEN into counts of the hand planes."""
+    counts = bytearray(HAND_PLANES)
+    if hand != "-":
+        piece_count = 0
+        for c in hand:
+            if c in "0123456789":
+                piece_count = piece_count * 10 + int(c)
+            else:
+                index = SFEN_HAND_INDICES.get(c)
+                if index is None:
+                    raise ValueError("invalid piece in pieces in hand part of sfen: {0}".format(repr(hand)))
+                counts[index] += piece_count or 1
+                piece_count = 0
+    return bytes(counts)
+
+
+def decode_sfen_chunk(sfens):
+    """
+    Decodes SFEN strings into the bytes of the square codes, hand counts and
+    turns and a list of the move numbers.
+    """
+    if len(sfen_row_cache) > SFEN_CACHE_SIZE:
+        sfen_row_cache.clear()
+    if len(sfen_hand_cache) > SFEN_CACHE_SIZE:
+        sfen_hand_cache.clear()
+
+    pieces = []
+    hands = []
+    turns = bytearray()
+    move_numbers = []
+
+    for sfen in sfens:
+        parts = sfen.split()
+        if len(parts) != 4:
+            raise ValueError("sfen string should consist of 4 parts: {0}".format(repr(sfen)))
+
+        rows = parts[0].split("/")
+        if len(rows) != 9:
+            raise ValueError("expected 9 rows in position part of sfen: {0}".format(repr(sfen)))
+        for row in rows:
+            squares = sfen_row_cache.get(row)
+            if squares is None:
+                squares = sfen_row_cache[row] = decode_sfen_row(row)
+            pieces.append(squares)
+
+        if parts[1] == "b":
+            turns.append(shogi.BLACK)
+        elif parts[1] == "w":
+            turns.append(shogi.WHITE)
+        else:
+            raise ValueError("expected 'b' or 'w' for turn part of sfen: {0}".format(repr(sfen)))
+
+        counts = sfen_hand_cache.get(parts[2])
+        if counts is None:
+            counts = sfen_hand_cache[parts[2]] = decode_sfen_hand(parts[2])
+        hands.append(counts)
+
+        move_number = int(parts[3])
+        if move_number < 0:
+            raise ValueError("fullmove number must be positive: {0}".format(repr(sfen)))
+        move_numbers.append(move_number or 1)
+
+    return b"".join(pieces), b"".join(hands), bytes(turns), move_numbers
+
+
+def decode_sfens(sfens, processes=None, chunk_size=10000):
+    """
+    Decodes an iterable of SFEN strings into a `DecodedSfens` tuple of arrays
+    without creating boards:
+    - `pieces` of shape (N, 81) with the code of the piece on each square
+      (see `SFEN_PIECE_CODES`),
+    - `hands` of shape (N, HAND_PLANES) with the counts of pieces in hand,
+    - `turns` and `move_numbers` of shape (N,).
+    If `processes` is given, chunks of `chunk_size` strings are decoded by that
+    many worker processes.
+    Raises `ValueError` if a SFEN string is invalid.
+    """
+    if processes is None:
+        chunks = [decode_sfen_chunk(sfens)]
+    else:
+        iterator = iter(sfens)
+        sfen_chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+        with multiprocessing.Pool(processes) as pool:
+            # imap() reads the chunks as the workers take them instead of
+            # reading all strings first.
+            chunks = list(pool.imap(decode_sfen_chunk, sfen_chunks))
+
+    pieces, hands, turns, move_numbers = zip(*chunks) if chunks else ((), (), (), ())
+    return DecodedSfens(
+        numpy.frombuffer(b"".join(pieces), dtype=numpy.uint8).reshape(-1, 81),
+        numpy.frombuffer(b"".join(hands), dtype=numpy.uint8).reshape(-1, HAND_PLANES),
+        numpy.frombuffer(b"".join(turns), dtype=numpy.uint8),
+        numpy.array(list(itertools.chain.from_iterable(move_numbers)), dtype=numpy.int64),
+    )
+
+
+def write_decoded_features(decoded, out=None, dtype=numpy.float32):
+    """
+    Writes the feature planes without attacks of SFEN strings decoded by
+    decode_sfens() into `out`, an array of shape (N, FEATURE_PLANES, 9, 9),
+    and returns it. A new array is allocated if `out` is not given.
+    """
+    count = len(decoded.turns)
+    if out is None:
+        out = numpy.empty((count, FEATURE_PLANES, 9, 9), dtype=dtype)
+
+    codes = numpy.arange(1, PIECE_PLANES + 1, dtype=numpy.uint8)
+    out[:, :PIECE_PLANES] = (decoded.pieces[:, None, :] == codes[None, :, None]).reshape(count, PIECE_PLANES, 9, 9)
+    out[:, PIECE_PLANES:TURN_PLANE] = decoded.hands.reshape(count, HAND_PLANES, 1, 1)
+    out[:, TURN_PLANE] = decoded.turns[:, None, None]
+    return out
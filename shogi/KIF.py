@@ -39,7 +39,7 @@ class ParserException(Exception):
 
 class Parser:
     MOVE_RE = re.compile(
-        r"\A *[0-9]+\s+(中断|投了|持将棋|先日手|詰み|切れ負け|反則勝ち|反則負け|(([１２３４５６７８９])([零一二三四五六七八九])|同　)([歩香桂銀金角飛玉と杏圭全馬龍])(打|(成?)\(([0-9])([0-9])\)))\s*(\([ /:0-9]+\))?\s*\Z"
+        r"\A *[0-9]+\s+(中断|投了|持将棋|千日手|詰み|切れ負け|反則勝ち|反則負け|(([１２３４５６７８９])([零一二三四五六七八九])|同　)([歩香桂銀金角飛玉と杏圭全馬龍])(打|(成?)\(([0-9])([0-9])\)))\s*(\([ /:0-9]+\))?\s*\Z"
     )
 
     HANDYCAP_SFENS = {
@@ -204,6 +204,21 @@ class Parser:
                 )
         return (None, last_to_square, None)
 
+    @staticmethod
+    def sennichite_winner(sfen, moves):
+        """
+        Gets the winner of a game ended by repetition, "-" for a draw or the
+        opponent of the side that gave perpetual check.
+        """
+        board = shogi.Board(sfen)
+        for move in moves:
+            board.push_usi(move)
+
+        color = board.perpetual_check_color()
+        if color is None:
+            return "-"
+        return "w" if color == shogi.BLACK else "b"
+
     @staticmethod
     def parse_str(kif_str):  # noqa: C901
         line_no = 1
@@ -215,6 +230,7 @@ class Parser:
         moves = []
         last_to_square = None
         win = None
+        sennichite = False
         custom_sfen = False
         kif_str = kif_str.replace("\r\n", "\n").replace("\r", "\n")
         for line in kif_str.split("\n"):
@@ -270,8 +286,10 @@ class Parser:
                         win = "b"
                     else:  # current_turn == shogi.WHITE
                         win = "w"
-                elif special_str in ["持将棋", "先日手"]:
+                elif special_str == "持将棋":
                     win = "-"
+                elif special_str == "千日手":
+                    sennichite = True
                 else:
                     m = Parser.RESULT_RE.match(line)
                     if m:
@@ -280,14 +298,20 @@ class Parser:
                             win = "b"
                         elif win_side_str == "後" or win_side_str == "上":
                             win = "w"
+                        elif m.group(2) == "千日手":
+                            sennichite = True
                         else:
-                            # TODO: repetition of moves with continuous check
                             win = "-"
             line_no += 1
 
         # if using a custom sfen
         if len(sfen.split(" ")) == 1:
-            sfen = Parser.complete_custom_sfen(sfen, pieces_in_hand, current_turn)
+            # The turn of the starting position, before the moves.
+            starting_turn = current_turn ^ (len(moves) % 2)
+            sfen = Parser.complete_custom_sfen(sfen, pieces_in_hand, starting_turn)
+
+        if sennichite:
+            win = Parser.sennichite_winner(sfen, moves)
 
         summary = {"names": names, "sfen": sfen, "moves": moves, "win": win}
 
@@ -5,6 +5,8 @@
 #       and opposite direction of files and ranks like '9i'.
 #       We use chess style notation internally, but exports it with this table.
 
+import numbers
+
 from .Consts import NONE
 from .Piece import PIECE_SYMBOLS, Piece
 
@@ -22,6 +24,80 @@ SQUARE_NAMES = [
 ]
 # fmt: on
 
+# A move can also be packed into an integer, which is what Move.__hash__()
+# returns: bits 0-6 hold the to square, bits 7-13 the from square or
+# 81 + the drop piece type and bit 14 the promotion flag.
+# The null move is packed into 0.
+PACKED_NULL_MOVE = 0
+
+# Packed moves are less than this number.
+PACKED_MOVES = 1 << 15
+
+
+def pack_move(from_square, to_square, promotion=False, drop_piece_type=None):
+    """
+    Packs a move into an integer. Takes the same arguments as `Move`, but
+    does not validate them.
+    """
+    if from_square is None:
+        if to_square is None:
+            return PACKED_NULL_MOVE
+        return to_square | (81 + drop_piece_type) << 7
+    return to_square | from_square << 7 | promotion << 14
+
+
+def packed_move(move):
+    """
+    Gets the packed move of a `Move` or a packed move, which can be any
+    integer type such as the integers of NumPy arrays.
+    """
+    if isinstance(move, numbers.Integral):
+        return int(move)
+    return move.packed()
+
+
+def unpack_move(move):
+    """
+    Gets a tuple of the from square, the to square, the promotion flag and the
+    drop piece type of a `Move` or a packed move.
+    """
+    if isinstance(move, numbers.Integral):
+        move = int(move)
+        if move == PACKED_NULL_MOVE:
+            return None, None, False, None
+        from_square = (move >> 7) & 127
+        if from_square > 81:
+            return None, move & 127, False, from_square - 81
+        return from_square, move & 127, bool(move >> 14), None
+    return move.from_square, move.to_square, move.promotion, move.drop_piece_type
+
+
+# A move can also be mapped to an index into a fixed space of
+# (from square or 80 + drop piece type) x to square x promotion, for example
+# to address the outputs of a policy network. The null move has no index.
+MOVE_INDICES = (81 + 7) * 81 * 2
+
+
+def index_move(from_square, to_square, promotion=False, drop_piece_type=None):
+    """
+    Gets the index of a move. Takes the same arguments as `Move`, but does
+    not validate them.
+    """
+    if from_square is None:
+        return ((80 + drop_piece_type) * 81 + to_square) * 2
+    return (from_square * 81 + to_square) * 2 + promotion
+
+
+def unindex_move(index):
+    """
+    Gets a tuple of the from square, the to square, the promotion flag and the
+    drop piece type of a move index.
+    """
+    from_square, to_square = divmod(index >> 1, 81)
+    if from_square >= 81:
+        return None, to_square, False, from_square - 80
+    return from_square, to_square, bool(index & 1), None
+
 
 class Move(object):
     """
@@ -30,6 +106,8 @@ class Move(object):
     Null moves are supported.
     """
 
+    __slots__ = ["from_square", "to_square", "promotion", "drop_piece_type"]
+
     def __init__(self, from_square, to_square, promotion=False, drop_piece_type=None):
         # if from_square is None, it's a drop and
         self.from_square = from_square
@@ -88,12 +166,37 @@ class Move(object):
         return self.usi()
 
     def __hash__(self):
+        return self.packed()
+
+    def __reduce__(self):
+        return (type(self), (self.from_square, self.to_square, self.promotion, self.drop_piece_type))
+
+    def packed(self):
+        """
+        Packs the move into an integer, which can be passed to
+        `Board.push()` and `Board.is_legal()` instead of the move.
+        """
         # 7 bit is enough to represent 81 patterns
-        if self.drop_piece_type is None:
-            return self.to_square | self.from_square << 7 | self.promotion << 14
-        else:
-            # drop piece
-            return self.to_square | (81 + self.drop_piece_type) << 7
+        return pack_move(self.from_square, self.to_square, self.promotion, self.drop_piece_type)
+
+    @classmethod
+    def from_packed(cls, packed):
+        """Creates a move from a packed move."""
+        return cls(*unpack_move(packed))
+
+    def index(self):
+        """
+        Gets the index of the move in the space of `MOVE_INDICES` moves.
+        Raises `ValueError` for the null move.
+        """
+        if not self:
+            raise ValueError("The null move has no index.")
+        return index_move(self.from_square, self.to_square, self.promotion, self.drop_piece_type)
+
+    @classmethod
+    def from_index(cls, index):
+        """Creates a move from a move index."""
+        return cls(*unindex_move(index))
 
     @classmethod
     def from_usi(cls, usi):
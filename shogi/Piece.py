@@ -7,6 +7,8 @@ PIECE_JAPANESE_SYMBOLS = ["", "歩", "香", "桂", "銀", "金", "角", "飛", "
 
 
 class Piece(object):
+    __slots__ = ["piece_type", "color"]
+
     def __init__(self, piece_type, color):
         if piece_type is None:
             raise ValueError("Piece type must be set")
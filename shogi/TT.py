@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# A transposition table of a fixed number of entries keyed by the Zobrist
+# hashes of positions, for searches on top of the library.
+#
+# The entries are 64-bit integers in an array, in buckets of two: the first
+# entry of a bucket keeps the deepest search of a position and the second one
+# is always replaced. The bits of an entry are, from the lowest bit on:
+# - The packed move (15 bits, see `shogi.pack_move()`), 0 if there is none.
+# - The score plus 32768 (16 bits).
+# - The depth (8 bits).
+# - The bound (2 bits).
+# - The generation of the search that stored it (6 bits).
+# - Bits 48 to 63 of the Zobrist hash to check the key (16 bits).
+# - Whether the entry is used (1 bit).
+
+import array
+import collections
+
+import shogi
+
+BOUND_NONE = 0
+BOUND_UPPER = 1
+BOUND_LOWER = 2
+BOUND_EXACT = BOUND_UPPER | BOUND_LOWER
+
+MIN_SCORE = -32768
+MAX_SCORE = 32767
+MAX_DEPTH = 255
+GENERATIONS = 64
+
+ENTRY_SIZE = 8
+BUCKET_ENTRIES = 2
+
+SCORE_SHIFT = 15
+DEPTH_SHIFT = 31
+BOUND_SHIFT = 39
+GENERATION_SHIFT = 41
+KEY_SHIFT = 47
+ENTRY_USED = 1 << 63
+
+MOVE_MASK = shogi.PACKED_MOVES - 1
+KEY_MASK = 0xFFFF << KEY_SHIFT
+GENERATION_MASK = (GENERATIONS - 1) << GENERATION_SHIFT
+
+TranspositionEntry = collections.namedtuple("TranspositionEntry", ["move", "score", "depth", "bound", "generation"])
+
+
+def entry_key(zobrist_hash):
+    """Gets the key check bits of an entry for the Zobrist hash."""
+    return ((zobrist_hash >> 48) & 0xFFFF) << KEY_SHIFT | ENTRY_USED
+
+
+def unpack_entry(entry):
+    """Unpacks a used entry."""
+    return TranspositionEntry(
+        entry & MOVE_MASK,
+        ((entry >> SCORE_SHIFT) & 0xFFFF) + MIN_SCORE,
+        (entry >> DEPTH_SHIFT) & 0xFF,
+        (entry >> BOUND_SHIFT) & 3,
+        (entry >> GENERATION_SHIFT) & (GENERATIONS - 1),
+    )
+
+
+class TranspositionTable(object):
+    """
+    A transposition table of `capacity` entries, which take 8 bytes each.
+    Counts the hits and misses of probes and the entries of other positions
+    overwritten by stores.
+    """
+
+    def __init__(self, capacity):
+        self.buckets = max(capacity // BUCKET_ENTRIES, 1)
+        self.entries = array.array("Q", [0]) * (self.buckets * BUCKET_ENTRIES)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+
+    @classmethod
+    def from_megabytes(cls, megabytes):
+        """Creates a table using at most the given number of megabytes."""
+        return cls(megabytes * 1024 * 1024 // ENTRY_SIZE)
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        self.entries = array.array("Q", [0]) * len(self.entries)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        """
+        Starts a new generation. Entries of older searches are replaced first.
+        """
+        self.generation = (self.generation + 1) % GENERATIONS
+
+    def probe(self, zobrist_hash):
+        """
+        Gets the `TranspositionEntry` of the position with the given Zobrist
+        hash, or `None`.
+        """
+        entries = self.entries
+        index = (zobrist_hash % self.buckets) * BUCKET_ENTRIES
+        key = entry_key(zobrist_hash)
+
+        for i in range(index, index + BUCKET_ENTRIES):
+            entry = entries[i]
+            if entry & (KEY_MASK | ENTRY_USED) == key:
+                self.hits += 1
+                # Keep the entry from being aged out.
+                entry = entries[i] = (entry & ~GENERATION_MASK) | self.generation << GENERATION_SHIFT
+                return unpack_entry(entry)
+
+        self.misses += 1
+        return None
+
+    def store(self, zobrist_hash, move, score, depth, bound):
+        """
+        Stores the result of a search of the position with the given Zobrist
+        hash. `move` is a move, a packed move or `None`.
+        Raises `ValueError` if the score, depth or bound are out of range.
+        """
+        if not MIN_SCORE <= score <= MAX_SCORE:
+            raise ValueError("score out of range: {0}".format(score))
+        if not 0 <= depth <= MAX_DEPTH:
+            raise ValueError("depth out of range: {0}".format(depth))
+        if not BOUND_NONE <= bound <= BOUND_EXACT:
+            raise ValueError("bound out of range: {0}".format(bound))
+
+        move = shogi.PACKED_NULL_MOVE if move is None else shogi.packed_move(move)
+
+        entries = self.entries
+        index = (zobrist_hash % self.buckets) * BUCKET_ENTRIES
+        key = entry_key(zobrist_hash)
+
+        for i in range(index, index + BUCKET_ENTRIES):
+            entry = entries[i]
+            if entry & (KEY_MASK | ENTRY_USED) == key:
+                # The same position. Keep its move if there is no new one.
+                if not move:
+                    move = entry & MOVE_MASK
+                break
+        else:
+            i = None
+            entry = entries[index]
+
+        # The first entry keeps the deeper search unless it is from an older
+        # search, or the new search of the same position is exact.
+        if i != index + 1 and (
+            not entry
+            or (entry >> GENERATION_SHIFT) & (GENERATIONS - 1) != self.generation
+            or depth >= (entry >> DEPTH_SHIFT) & 0xFF
+            or (i == index and bound == BOUND_EXACT)
+        ):
+            i = index
+        else:
+            i = index + 1
+            entry = entries[i]
+        if entry and entry & (KEY_MASK | ENTRY_USED) != key:
+            self.overwrites += 1
+
+        entries[i] = (
+            key
+            | move
+            | (score - MIN_SCORE) << SCORE_SHIFT
+            | depth << DEPTH_SHIFT
+            | bound << BOUND_SHIFT
+            | self.generation << GENERATION_SHIFT
+        )
+
+    def hashfull(self):
+        """
+        Gets the permille of the first 1000 entries that were stored in the
+        current search, as reported to USI GUIs.
+        """
+        entries = self.entries[:1000]
+        used = sum(
+            1 for entry in entries if entry and (entry >> GENERATION_SHIFT) & (GENERATIONS - 1) == self.generation
+        )
+        return used * 1000 // len(entries)
+
+    def __len__(self):
+        return len(self.entries)
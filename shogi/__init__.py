@@ -19,7 +19,13 @@
 
 # flake8: noqa F405
 
-import collections
+import array
+import marshal
+import mmap
+import numbers
+import os
+import random
+import sys
 
 from .Consts import *
 from .Move import *
@@ -59,6 +65,11 @@ MAX_PIECES_IN_HAND = [
     0,
 ]
 
+# Flags of generate_moves() enabling all or no piece types.
+ALL_MOVE_FLAGS = [False] + [True] * len(PIECE_TYPES)
+ALL_DROP_FLAGS = [False] + [True] * (KING - PAWN)
+NO_DROP_FLAGS = [False] * KING
+
 PIECE_PROMOTED = [
     None,
     PROM_PAWN,
@@ -77,6 +88,27 @@ PIECE_PROMOTED = [
     None,
 ]
 
+PIECE_UNPROMOTED = [
+    NONE,
+    PAWN,
+    LANCE,
+    KNIGHT,
+    SILVER,
+    GOLD,
+    BISHOP,
+    ROOK,
+    KING,
+    PAWN,
+    LANCE,
+    KNIGHT,
+    SILVER,
+    BISHOP,
+    ROOK,
+]
+
+# Pieces in hand are counted in lists indexed by NONE to ROOK.
+HAND_PIECE_TYPES = [ROOK, BISHOP, GOLD, SILVER, KNIGHT, LANCE, PAWN]
+
 NUMBER_JAPANESE_NUMBER_SYMBOLS = ["０", "１", "２", "３", "４", "５", "６", "７", "８", "９"]
 NUMBER_JAPANESE_KANJI_SYMBOLS = [
     "零",
@@ -336,54 +368,6 @@ for bb_square in BB_SQUARES:
     mask |= shift_down_right(bb_square)
     BB_KING_ATTACKS.append(mask & BB_ALL)
 
-# 128 means 2 ^ (9 - 1 - 1), patterns of emptiness of one row without each ends
-BB_RANK_ATTACKS = [[BB_VOID for i in range(128)] for k in SQUARES]
-BB_FILE_ATTACKS = [[BB_VOID for i in range(128)] for k in SQUARES]
-BB_LANCE_ATTACKS = [
-    [[BB_VOID for i in range(128)] for k in SQUARES],
-    [[BB_VOID for i in range(128)] for k in SQUARES],
-]
-
-for square in SQUARES:
-    for bitrow in range(0, 128):
-        f = file_index(square) + 1
-        q = square + 1
-        while f < 9:
-            BB_RANK_ATTACKS[square][bitrow] |= BB_SQUARES[q]
-            if (1 << f) & (bitrow << 1):
-                break
-            q += 1
-            f += 1
-
-        f = file_index(square) - 1
-        q = square - 1
-        while f >= 0:
-            BB_RANK_ATTACKS[square][bitrow] |= BB_SQUARES[q]
-            if (1 << f) & (bitrow << 1):
-                break
-            q -= 1
-            f -= 1
-
-        r = rank_index(square) + 1
-        q = square + 9
-        while r < 9:
-            BB_FILE_ATTACKS[square][bitrow] |= BB_SQUARES[q]
-            BB_LANCE_ATTACKS[WHITE][square][bitrow] |= BB_SQUARES[q]
-            if (1 << (8 - r)) & (bitrow << 1):
-                break
-            q += 9
-            r += 1
-
-        r = rank_index(square) - 1
-        q = square - 9
-        while r >= 0:
-            BB_FILE_ATTACKS[square][bitrow] |= BB_SQUARES[q]
-            BB_LANCE_ATTACKS[BLACK][square][bitrow] |= BB_SQUARES[q]
-            if (1 << (8 - r)) & (bitrow << 1):
-                break
-            q -= 9
-            r -= 1
-
 # fmt: off
 BB_SHIFT_R45 = [
     1, 73, 65, 57, 49, 41, 33, 25, 17,
@@ -410,46 +394,256 @@ BB_SHIFT_L45 = [
 ]
 # fmt: on
 
-BB_L45_ATTACKS = [[BB_VOID for i in range(128)] for k in SQUARES]
-BB_R45_ATTACKS = [[BB_VOID for i in range(128)] for k in SQUARES]
+# Version of the slider attack tables. Bump it whenever
+# generate_slider_attack_tables() changes to invalidate cached tables.
+SLIDER_ATTACK_TABLES_VERSION = 1
 
-for s in SQUARES:
-    for b in range(0, 128):
-        mask = BB_VOID
 
-        q = s
-        while file_index(q) > 0 and rank_index(q) < 8:
-            q += 8
-            mask |= BB_SQUARES[q]
-            if b & (BB_SQUARES_L45[q] >> BB_SHIFT_L45[s]):
-                break
+def generate_slider_attack_tables():
+    """
+    Generates the attack tables of sliding pieces indexed by a square and
+    an occupancy pattern of the rank, file or diagonal, which are returned as
+    a tuple of rank, file, lance, right 45 degree and left 45 degree attacks.
+    """
+    # 128 means 2 ^ (9 - 1 - 1), patterns of emptiness of one row without each ends
+    rank_attacks = [[BB_VOID for i in range(128)] for k in SQUARES]
+    file_attacks = [[BB_VOID for i in range(128)] for k in SQUARES]
+    lance_attacks = [
+        [[BB_VOID for i in range(128)] for k in SQUARES],
+        [[BB_VOID for i in range(128)] for k in SQUARES],
+    ]
+
+    for square in SQUARES:
+        for bitrow in range(0, 128):
+            f = file_index(square) + 1
+            q = square + 1
+            while f < 9:
+                rank_attacks[square][bitrow] |= BB_SQUARES[q]
+                if (1 << f) & (bitrow << 1):
+                    break
+                q += 1
+                f += 1
+
+            f = file_index(square) - 1
+            q = square - 1
+            while f >= 0:
+                rank_attacks[square][bitrow] |= BB_SQUARES[q]
+                if (1 << f) & (bitrow << 1):
+                    break
+                q -= 1
+                f -= 1
+
+            r = rank_index(square) + 1
+            q = square + 9
+            while r < 9:
+                file_attacks[square][bitrow] |= BB_SQUARES[q]
+                lance_attacks[WHITE][square][bitrow] |= BB_SQUARES[q]
+                if (1 << (8 - r)) & (bitrow << 1):
+                    break
+                q += 9
+                r += 1
+
+            r = rank_index(square) - 1
+            q = square - 9
+            while r >= 0:
+                file_attacks[square][bitrow] |= BB_SQUARES[q]
+                lance_attacks[BLACK][square][bitrow] |= BB_SQUARES[q]
+                if (1 << (8 - r)) & (bitrow << 1):
+                    break
+                q -= 9
+                r -= 1
+
+    l45_attacks = [[BB_VOID for i in range(128)] for k in SQUARES]
+    r45_attacks = [[BB_VOID for i in range(128)] for k in SQUARES]
+
+    for s in SQUARES:
+        for b in range(0, 128):
+            mask = BB_VOID
+
+            q = s
+            while file_index(q) > 0 and rank_index(q) < 8:
+                q += 8
+                mask |= BB_SQUARES[q]
+                if b & (BB_SQUARES_L45[q] >> BB_SHIFT_L45[s]):
+                    break
+
+            q = s
+            while file_index(q) < 8 and rank_index(q) > 0:
+                q -= 8
+                mask |= BB_SQUARES[q]
+                if b & (BB_SQUARES_L45[q] >> BB_SHIFT_L45[s]):
+                    break
+
+            l45_attacks[s][b] = mask
+
+            mask = BB_VOID
+
+            q = s
+            while file_index(q) < 8 and rank_index(q) < 8:
+                q += 10
+                mask |= BB_SQUARES[q]
+                if b & (BB_SQUARES_R45[q] >> BB_SHIFT_R45[s]):
+                    break
+
+            q = s
+            while file_index(q) > 0 and rank_index(q) > 0:
+                q -= 10
+                mask |= BB_SQUARES[q]
+                if b & (BB_SQUARES_R45[q] >> BB_SHIFT_R45[s]):
+                    break
+
+            r45_attacks[s][b] = mask
+
+    return rank_attacks, file_attacks, lance_attacks, r45_attacks, l45_attacks
+
+
+def slider_attack_tables_cache_path():
+    """
+    Gets the path of the cache file of the slider attack tables or `None`
+    if caching is disabled.
+    The directory defaults to `python-shogi` in the user cache directory
+    and can be changed with the `PYTHON_SHOGI_CACHE_DIR` environment variable.
+    Setting it to an empty string disables the cache.
+    """
+    cache_dir = os.environ.get("PYTHON_SHOGI_CACHE_DIR")
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "python-shogi"
+        )
+    if not cache_dir:
+        return None
+    return os.path.join(
+        cache_dir,
+        "slider-attacks-v{0}-py{1}{2}.marshal".format(
+            SLIDER_ATTACK_TABLES_VERSION, sys.version_info[0], sys.version_info[1]
+        ),
+    )
 
-        q = s
-        while file_index(q) < 8 and rank_index(q) > 0:
-            q -= 8
-            mask |= BB_SQUARES[q]
-            if b & (BB_SQUARES_L45[q] >> BB_SHIFT_L45[s]):
-                break
 
-        BB_L45_ATTACKS[s][b] = mask
+def load_slider_attack_tables():
+    """
+    Loads the slider attack tables from the cache file, generating and
+    caching them if the cache is missing or unusable.
+    """
+    path = slider_attack_tables_cache_path()
+    if path is not None:
+        try:
+            with open(path, "rb") as f:
+                tables = marshal.loads(f.read())
+            if isinstance(tables, tuple) and len(tables) == 5:
+                return tables
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
 
-        mask = BB_VOID
+    tables = generate_slider_attack_tables()
 
-        q = s
-        while file_index(q) < 8 and rank_index(q) < 8:
-            q += 10
-            mask |= BB_SQUARES[q]
-            if b & (BB_SQUARES_R45[q] >> BB_SHIFT_R45[s]):
-                break
+    if path is not None:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(temp_path, "wb") as f:
+                f.write(marshal.dumps(tables))
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+
+    return tables
+
+
+BB_RANK_ATTACKS, BB_FILE_ATTACKS, BB_LANCE_ATTACKS, BB_R45_ATTACKS, BB_L45_ATTACKS = load_slider_attack_tables()
+
+# The tables above are indexed by 7 bits of rotated bitboards. Ranks can be
+# indexed by shifting the plain occupancy, and files and diagonals by
+# multiplying the masked plain occupancy with a magic number: each square q
+# that has bit k in the rotated index contributes 2 ^ (MAGIC_SHIFT + k - q),
+# which moves the square to bit MAGIC_SHIFT + k. The other partial products
+# of the squares of a line never overlap these bits, so there are no carries.
+MAGIC_SHIFT = 81
 
-        q = s
-        while file_index(q) > 0 and rank_index(q) > 0:
-            q -= 10
+BB_RANK_SHIFTS = [rank_index(square) * 9 + 1 for square in SQUARES]
+
+
+def slider_magic(square, squares, rotated_squares, shift):
+    mask = BB_VOID
+    magic = 0
+    for q in squares:
+        k = rotated_squares[q] - shift
+        if q != square and 0 <= k < 7:
             mask |= BB_SQUARES[q]
-            if b & (BB_SQUARES_R45[q] >> BB_SHIFT_R45[s]):
-                break
+            magic |= 1 << (MAGIC_SHIFT + k - q)
+    return mask, magic
+
+
+BB_FILE_MASKS, BB_FILE_MAGICS = zip(
+    *[
+        slider_magic(
+            square,
+            [q for q in SQUARES if file_index(q) == file_index(square)],
+            SQUARES_L90,
+            file_index(square) * 9 + 1,
+        )
+        for square in SQUARES
+    ]
+)
+BB_R45_MASKS, BB_R45_MAGICS = zip(
+    *[
+        slider_magic(
+            square,
+            [q for q in SQUARES if file_index(q) - rank_index(q) == file_index(square) - rank_index(square)],
+            SQUARES_R45,
+            BB_SHIFT_R45[square],
+        )
+        for square in SQUARES
+    ]
+)
+BB_L45_MASKS, BB_L45_MAGICS = zip(
+    *[
+        slider_magic(
+            square,
+            [q for q in SQUARES if file_index(q) + rank_index(q) == file_index(square) + rank_index(square)],
+            SQUARES_L45,
+            BB_SHIFT_L45[square],
+        )
+        for square in SQUARES
+    ]
+)
+
+# Attacks of sliding pieces on an empty board.
+BB_ROOK_RAYS = [BB_RANK_ATTACKS[square][0] | BB_FILE_ATTACKS[square][0] for square in SQUARES]
+BB_BISHOP_RAYS = [BB_R45_ATTACKS[square][0] | BB_L45_ATTACKS[square][0] for square in SQUARES]
+
+# Squares strictly between two squares on the same rank, file or diagonal.
+BB_BETWEEN = [[BB_VOID for i in SQUARES] for k in SQUARES]
+
+for square in SQUARES:
+    for delta_file, delta_rank in [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
+        mask = BB_VOID
+        f = file_index(square) + delta_file
+        r = rank_index(square) + delta_rank
+        while 0 <= f < 9 and 0 <= r < 9:
+            BB_BETWEEN[square][r * 9 + f] = mask
+            mask |= BB_SQUARES[r * 9 + f]
+            f += delta_file
+            r += delta_rank
 
-        BB_R45_ATTACKS[s][b] = mask
+# Squares of the whole rank, file or diagonal through two squares.
+BB_LINES = [[BB_VOID for i in SQUARES] for k in SQUARES]
+
+for square in SQUARES:
+    for delta_file, delta_rank in [(1, 0), (0, 1), (1, 1), (1, -1)]:
+        line = [square]
+        for sign in [1, -1]:
+            f = file_index(square) + sign * delta_file
+            r = rank_index(square) + sign * delta_rank
+            while 0 <= f < 9 and 0 <= r < 9:
+                line.append(r * 9 + f)
+                f += sign * delta_file
+                r += sign * delta_rank
+        mask = BB_VOID
+        for i in line:
+            mask |= BB_SQUARES[i]
+        for i in line[1:]:
+            BB_LINES[square][i] = mask
 
 try:
     from gmpy2 import bit_scan1 as bit_scan
@@ -459,61 +653,161 @@ except ImportError:
         from gmpy import popcount as pop_count
         from gmpy import scan1 as bit_scan
     except ImportError:
+        if hasattr(int, "bit_count"):
+            pop_count = int.bit_count
+        else:
 
-        def pop_count(b):
-            return bin(b).count("1")
+            def pop_count(b):
+                return bin(b).count("1")
 
         def bit_scan(b, n=0):
-            string = bin(b)
-            l = len(string)
-            r = string.rfind("1", 0, l - n)
-            if r == -1:
+            b >>= n
+            if not b:
                 return -1
-            else:
-                return l - r - 1
+            return n + (b & -b).bit_length() - 1
+
+
+def scan_forward(b):
+    """
+    Yields the indices of the set bits of the given integer, the squares of
+    a bitboard, from the lowest one.
+    """
+    while b:
+        r = b & -b
+        yield r.bit_length() - 1
+        b ^= r
+
+
+BB_PROMOTION_ZONES = [BB_RANK_A | BB_RANK_B | BB_RANK_C, BB_RANK_G | BB_RANK_H | BB_RANK_I]
+
+# Squares a piece can not move to or be dropped on without promotion.
+BB_MUST_PROMOTE = [[BB_VOID for piece_type in PIECE_TYPES_WITH_NONE] for color in COLORS]
+BB_MUST_PROMOTE[BLACK][PAWN] = BB_RANK_A
+BB_MUST_PROMOTE[BLACK][LANCE] = BB_RANK_A
+BB_MUST_PROMOTE[BLACK][KNIGHT] = BB_RANK_A | BB_RANK_B
+BB_MUST_PROMOTE[WHITE][PAWN] = BB_RANK_I
+BB_MUST_PROMOTE[WHITE][LANCE] = BB_RANK_I
+BB_MUST_PROMOTE[WHITE][KNIGHT] = BB_RANK_H | BB_RANK_I
+
+
+# Squares a piece can promote on, when moving from or to them.
+BB_CAN_PROMOTE = [[BB_VOID for piece_type in PIECE_TYPES_WITH_NONE] for color in COLORS]
+for color in COLORS:
+    for piece_type in [PAWN, LANCE, KNIGHT, SILVER, BISHOP, ROOK]:
+        BB_CAN_PROMOTE[color][piece_type] = BB_PROMOTION_ZONES[color]
 
 
 def can_promote(square, piece_type, color):
-    if piece_type not in [PAWN, LANCE, KNIGHT, SILVER, BISHOP, ROOK]:
-        return False
-    elif color == BLACK:
-        return rank_index(square) <= 2
-    else:
-        return rank_index(square) >= 6
+    return bool(BB_CAN_PROMOTE[color][piece_type] & BB_SQUARES[square])
 
 
 def can_move_without_promotion(to_square, piece_type, color):
-    if color == BLACK:
-        return (
-            (piece_type != PAWN and piece_type != LANCE and piece_type != KNIGHT)
-            or (piece_type == PAWN and rank_index(to_square) > 0)
-            or (piece_type == LANCE and rank_index(to_square) > 0)
-            or (piece_type == KNIGHT and rank_index(to_square) > 1)
-        )
-    else:
-        return (
-            (piece_type != PAWN and piece_type != LANCE and piece_type != KNIGHT)
-            or (piece_type == PAWN and rank_index(to_square) < 8)
-            or (piece_type == LANCE and rank_index(to_square) < 8)
-            or (piece_type == KNIGHT and rank_index(to_square) < 7)
-        )
+    return not BB_MUST_PROMOTE[color][piece_type] & BB_SQUARES[to_square]
+
+
+# Indices into the random arrays of Zobrist hashes. A piece in hand has a key
+# for each count, so adding or removing the n-th piece of a type toggles the
+# n-th key of the type.
+ZOBRIST_TURN_INDEX = 2268
+ZOBRIST_HAND_INDICES = [[0] * KING, [0] * KING]
+ZOBRIST_ARRAY_SIZE = ZOBRIST_TURN_INDEX + 1
+for color in COLORS:
+    for piece_type in range(PAWN, KING):
+        ZOBRIST_HAND_INDICES[color][piece_type] = ZOBRIST_ARRAY_SIZE
+        ZOBRIST_ARRAY_SIZE += MAX_PIECES_IN_HAND[piece_type]
+
+
+def zobrist_hand_index(color, piece_type, count):
+    """
+    Gets the index of the key of the `count`-th piece of the given type in
+    hand. Counts above the number of pieces in a game reuse the keys.
+    """
+    return ZOBRIST_HAND_INDICES[color][piece_type] + (count - 1) % MAX_PIECES_IN_HAND[piece_type]
+
+
+def check_zobrist_array(array):
+    """
+    Raises `ValueError` if the random array of Zobrist hashes has less than
+    `ZOBRIST_ARRAY_SIZE` keys.
+    """
+    if len(array) < ZOBRIST_ARRAY_SIZE:
+        raise ValueError("Zobrist arrays need {0} keys, got {1}".format(ZOBRIST_ARRAY_SIZE, len(array)))
+
+
+# SFEN symbols of the pieces by color and piece type and of runs of empty squares.
+SFEN_PIECE_SYMBOLS = [[Piece(piece_type, color).symbol() for piece_type in PIECE_TYPES_WITH_NONE] for color in COLORS]
+SFEN_EMPTY_SQUARES = [str(empty) for empty in range(10)]
+
+# Positions can be packed into 256 bits, modelled on the packed SFEN of shogi
+# engine training data. The bits are written from the lowest bit of the
+# first byte on:
+# - The side to move (1 bit) and the squares of the black and white kings
+#   (7 bits each, numbered from 1a down each file to 9i).
+# - The other squares in the same order, as a Huffman code of the unpromoted
+#   piece type (a single 0 bit for an empty square), a promotion bit unless
+#   the piece is a gold and a color bit.
+# - For each color the pieces in hand in the order PAWN, LANCE, KNIGHT,
+#   SILVER, BISHOP, ROOK, GOLD, with the code of the piece type without its
+#   first bit, a 0 promotion bit unless the piece is a gold and a color bit.
+# Only positions with all 40 pieces fill exactly 256 bits, so only those can
+# be packed. The move number is not packed.
+PACKED_POSITION_SIZE = 32
+
+PACKED_PIECE_CODES = [
+    (0x00, 1),  # NONE
+    (0x01, 2),  # PAWN
+    (0x03, 4),  # LANCE
+    (0x0B, 4),  # KNIGHT
+    (0x07, 4),  # SILVER
+    (0x0F, 5),  # GOLD
+    (0x1F, 6),  # BISHOP
+    (0x3F, 6),  # ROOK
+]
+PACKED_HAND_PIECE_TYPES = [PAWN, LANCE, KNIGHT, SILVER, BISHOP, ROOK, GOLD]
+PACKED_PIECE_COUNTS = [0, 18, 4, 4, 4, 4, 2, 2, 2]
+PACKED_SQUARES = [(8 - file_index(square)) * 9 + rank_index(square) for square in SQUARES]
+PACKED_SQUARES_INVERSE = [PACKED_SQUARES.index(i) for i in SQUARES]
+
+
+def packed_piece_counts(pieces, pieces_in_hand):
+    """
+    Counts the pieces of each unpromoted type on the board and in hand, given
+    the piece types of the squares and the pieces in hand of both sides.
+    Positions can be packed if the counts are `PACKED_PIECE_COUNTS`.
+    """
+    counts = [0] * len(PACKED_PIECE_COUNTS)
+    for piece_type in pieces:
+        counts[PIECE_UNPROMOTED[piece_type]] += 1
+    for color in COLORS:
+        for piece_type in HAND_PIECE_TYPES:
+            counts[piece_type] += pieces_in_hand[color][piece_type]
+    counts[NONE] = 0
+    return counts
+
+
+# Piece types and code lengths by the next 6 bits on the board and the next
+# 5 bits in hand.
+PACKED_BOARD_DECODING = [None] * 64
+PACKED_HAND_DECODING = [None] * 32
+for piece_type, (code, bits) in enumerate(PACKED_PIECE_CODES):
+    for high in range(1 << (6 - bits)):
+        PACKED_BOARD_DECODING[code | high << bits] = (piece_type, bits)
+    if piece_type:
+        for high in range(1 << (6 - bits)):
+            PACKED_HAND_DECODING[(code >> 1) | high << (bits - 1)] = (piece_type, bits - 1)
 
 
 class Occupied(object):
+    """
+    The occupancy of the board by each side. Attacks of sliding pieces are
+    looked up from the plain occupancy with magic multipliers.
+    """
+
+    __slots__ = ["by_color", "bits"]
+
     def __init__(self, occupied_by_black, occupied_by_white):
         self.by_color = [occupied_by_black, occupied_by_white]
         self.bits = occupied_by_black | occupied_by_white
-        self.l45 = BB_VOID
-        self.r45 = BB_VOID
-        self.l90 = BB_VOID
-        self.update_rotated()
-
-    def update_rotated(self):
-        for i in SQUARES:
-            if BB_SQUARES[i] & self.bits:
-                self.l90 |= BB_SQUARES_L90[i]
-                self.r45 |= BB_SQUARES_R45[i]
-                self.l45 |= BB_SQUARES_L45[i]
 
     def __getitem__(self, key):
         if key in COLORS:
@@ -523,13 +817,37 @@ class Occupied(object):
     def ixor(self, mask, color, square):
         self.bits ^= mask
         self.by_color[color] ^= mask
-        self.l90 ^= BB_SQUARES[SQUARES_L90[square]]
-        self.r45 ^= BB_SQUARES[SQUARES_R45[square]]
-        self.l45 ^= BB_SQUARES[SQUARES_L45[square]]
+
+    def copy(self):
+        occupied = type(self).__new__(type(self))
+        occupied.by_color = self.by_color[:]
+        occupied.bits = self.bits
+        return occupied
 
     def non_occupied(self):
         return ~self.bits & BB_ALL
 
+    def lance_attacks(self, color, square):
+        return BB_LANCE_ATTACKS[color][square][
+            (((self.bits & BB_FILE_MASKS[square]) * BB_FILE_MAGICS[square]) >> MAGIC_SHIFT) & 127
+        ]
+
+    def rook_attacks(self, square):
+        return (
+            BB_RANK_ATTACKS[square][(self.bits >> BB_RANK_SHIFTS[square]) & 127]
+            | BB_FILE_ATTACKS[square][
+                (((self.bits & BB_FILE_MASKS[square]) * BB_FILE_MAGICS[square]) >> MAGIC_SHIFT) & 127
+            ]
+        )
+
+    def bishop_attacks(self, square):
+        return (
+            BB_R45_ATTACKS[square][(((self.bits & BB_R45_MASKS[square]) * BB_R45_MAGICS[square]) >> MAGIC_SHIFT) & 127]
+            | BB_L45_ATTACKS[square][
+                (((self.bits & BB_L45_MASKS[square]) * BB_L45_MAGICS[square]) >> MAGIC_SHIFT) & 127
+            ]
+        )
+
     def __eq__(self, occupied):
         return not self.__ne__(occupied)
 
@@ -541,7 +859,81 @@ class Occupied(object):
         return False
 
     def __repr__(self):
-        return "Occupied({0})".format(repr(self.by_color))
+        return "{0}({1})".format(type(self).__name__, repr(self.by_color))
+
+
+class RotatedOccupied(Occupied):
+    """
+    The occupancy of the board by each side, which also maintains rotated
+    bitboards to look up attacks of sliding pieces.
+    Use it by setting `Board.occupied_class`.
+    """
+
+    __slots__ = ["l45", "r45", "l90"]
+
+    def __init__(self, occupied_by_black, occupied_by_white):
+        super(RotatedOccupied, self).__init__(occupied_by_black, occupied_by_white)
+        self.l45 = BB_VOID
+        self.r45 = BB_VOID
+        self.l90 = BB_VOID
+        self.update_rotated()
+
+    def update_rotated(self):
+        for i in SQUARES:
+            if BB_SQUARES[i] & self.bits:
+                self.l90 |= BB_SQUARES_L90[i]
+                self.r45 |= BB_SQUARES_R45[i]
+                self.l45 |= BB_SQUARES_L45[i]
+
+    def ixor(self, mask, color, square):
+        self.bits ^= mask
+        self.by_color[color] ^= mask
+        self.l90 ^= BB_SQUARES[SQUARES_L90[square]]
+        self.r45 ^= BB_SQUARES[SQUARES_R45[square]]
+        self.l45 ^= BB_SQUARES[SQUARES_L45[square]]
+
+    def lance_attacks(self, color, square):
+        return BB_LANCE_ATTACKS[color][square][(self.l90 >> (((square % 9) * 9) + 1)) & 127]
+
+    def rook_attacks(self, square):
+        return (
+            BB_RANK_ATTACKS[square][(self.bits >> (((square // 9) * 9) + 1)) & 127]
+            | BB_FILE_ATTACKS[square][(self.l90 >> (((square % 9) * 9) + 1)) & 127]
+        )
+
+    def bishop_attacks(self, square):
+        return (
+            BB_R45_ATTACKS[square][(self.r45 >> BB_SHIFT_R45[square]) & 127]
+            | BB_L45_ATTACKS[square][(self.l45 >> BB_SHIFT_L45[square]) & 127]
+        )
+
+    def copy(self):
+        occupied = super(RotatedOccupied, self).copy()
+        occupied.l45 = self.l45
+        occupied.r45 = self.r45
+        occupied.l90 = self.l90
+        return occupied
+
+
+# Functions getting the attacks of a piece type from a square, given the
+# occupancy and the side the piece belongs to.
+PIECE_ATTACKS = [
+    lambda square, occupied, color: BB_VOID,
+    lambda square, occupied, color: BB_PAWN_ATTACKS[color][square],
+    lambda square, occupied, color: occupied.lance_attacks(color, square),
+    lambda square, occupied, color: BB_KNIGHT_ATTACKS[color][square],
+    lambda square, occupied, color: BB_SILVER_ATTACKS[color][square],
+    lambda square, occupied, color: BB_GOLD_ATTACKS[color][square],
+    lambda square, occupied, color: occupied.bishop_attacks(square),
+    lambda square, occupied, color: occupied.rook_attacks(square),
+    lambda square, occupied, color: BB_KING_ATTACKS[square],
+    lambda square, occupied, color: BB_GOLD_ATTACKS[color][square],
+    lambda square, occupied, color: BB_GOLD_ATTACKS[color][square],
+    lambda square, occupied, color: BB_GOLD_ATTACKS[color][square],
+    lambda square, occupied, color: BB_GOLD_ATTACKS[color][square],
+    lambda square, occupied, color: BB_KING_ATTACKS[square] | occupied.bishop_attacks(square),
+    lambda square, occupied, color: BB_KING_ATTACKS[square] | occupied.rook_attacks(square),
+]
 
 
 class Board(object):
@@ -554,7 +946,38 @@ class Board(object):
     specified in the optional `sfen` argument.
     """
 
-    def __init__(self, sfen=None):
+    # The class keeping track of the occupancy, which also decides how
+    # attacks of sliding pieces are looked up.
+    occupied_class = Occupied
+
+    __slots__ = [
+        "pseudo_legal_moves",
+        "legal_moves",
+        "piece_bb",
+        "pieces_in_hand",
+        "occupied",
+        "king_squares",
+        "pieces",
+        "turn",
+        "move_number",
+        "stack",
+        "check_state",
+        "sfen_ranks",
+        "zobrist_array",
+        "incremental_zobrist_hash",
+        "hash_history",
+    ]
+
+    def __init__(self, sfen=None, zobrist_array=None):
+        """
+        Creates a board with the starting position or the given SFEN. The keys
+        of `zobrist_array` are used for the incremental Zobrist hash, for
+        example `WIDE_RANDOM_ARRAY` for 128-bit hashes.
+        """
+        if zobrist_array is None:
+            zobrist_array = DEFAULT_RANDOM_ARRAY
+        check_zobrist_array(zobrist_array)
+        self.zobrist_array = zobrist_array
         self.pseudo_legal_moves = PseudoLegalMoveGenerator(self)
         self.legal_moves = LegalMoveGenerator(self)
 
@@ -583,9 +1006,11 @@ class Board(object):
             BB_VOID,  # PROM_ROOK
         ]
 
-        self.pieces_in_hand = [collections.Counter(), collections.Counter()]
+        self.pieces_in_hand = [[0] * KING, [0] * KING]
 
-        self.occupied = Occupied(BB_RANK_G | BB_H2 | BB_H8 | BB_RANK_I, BB_RANK_A | BB_B2 | BB_B8 | BB_RANK_C)
+        self.occupied = self.occupied_class(
+            BB_RANK_G | BB_H2 | BB_H8 | BB_RANK_I, BB_RANK_A | BB_B2 | BB_B8 | BB_RANK_C
+        )
 
         self.king_squares = [I5, A5]
         self.pieces = [NONE for i in SQUARES]
@@ -598,10 +1023,11 @@ class Board(object):
 
         self.turn = BLACK
         self.move_number = 1
-        self.captured_piece_stack = collections.deque()
-        self.move_stack = collections.deque()
-        self.incremental_zobrist_hash = self.board_zobrist_hash(DEFAULT_RANDOM_ARRAY)
-        self.transpositions = collections.Counter((self.zobrist_hash(),))
+        self.stack = []
+        self.check_state = None
+        self.sfen_ranks = [None] * 9
+        self.incremental_zobrist_hash = self.zobrist_hash(self.zobrist_array)
+        self.hash_history = [self.zobrist_hash()]
 
     def clear(self):
         self.piece_bb = [
@@ -622,19 +1048,20 @@ class Board(object):
             BB_VOID,  # PROM_ROOK
         ]
 
-        self.pieces_in_hand = [collections.Counter(), collections.Counter()]
+        self.pieces_in_hand = [[0] * KING, [0] * KING]
 
-        self.occupied = Occupied(BB_VOID, BB_VOID)
+        self.occupied = self.occupied_class(BB_VOID, BB_VOID)
 
         self.king_squares = [None, None]
         self.pieces = [NONE for i in SQUARES]
 
         self.turn = BLACK
         self.move_number = 1
-        self.captured_piece_stack = collections.deque()
-        self.move_stack = collections.deque()
-        self.incremental_zobrist_hash = self.board_zobrist_hash(DEFAULT_RANDOM_ARRAY)
-        self.transpositions = collections.Counter((self.zobrist_hash(),))
+        self.stack = []
+        self.check_state = None
+        self.sfen_ranks = [None] * 9
+        self.incremental_zobrist_hash = self.board_zobrist_hash(self.zobrist_array)
+        self.hash_history = [self.zobrist_hash()]
 
     def piece_at(self, square):
         """Gets the piece at the given square."""
@@ -649,26 +1076,41 @@ class Board(object):
         """Gets the piece type at the given square."""
         return self.pieces[square]
 
+    @property
+    def move_stack(self):
+        """
+        Gets a new list of the moves made so far, built from the undo records
+        in `stack`. Changing the list does not change the board. Use
+        `len(board.stack)` and `peek()` to get the number of moves and the
+        last move without building the list.
+        """
+        return [record[0] for record in self.stack]
+
+    @property
+    def captured_piece_stack(self):
+        """
+        Gets a new list of the piece types captured by the moves made so far,
+        built from the undo records in `stack`.
+        """
+        return [record[1] for record in self.stack]
+
     def add_piece_into_hand(self, piece_type, color, count=1):
         p = self.pieces_in_hand[color]
-        if piece_type >= PROM_PAWN:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-        p[piece_type] += count
+        piece_type = PIECE_UNPROMOTED[piece_type]
+        for i in range(count):
+            p[piece_type] += 1
+            self.incremental_zobrist_hash ^= self.zobrist_array[zobrist_hand_index(color, piece_type, p[piece_type])]
 
     def remove_piece_from_hand(self, piece_type, color):
         p = self.pieces_in_hand[color]
-        if piece_type >= PROM_PAWN:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-        p[piece_type] -= 1
-        if p[piece_type] == 0:
-            del p[piece_type]
-        elif p[piece_type] < 0:
+        piece_type = PIECE_UNPROMOTED[piece_type]
+        if not p[piece_type]:
             raise ValueError("The piece is not in hand: {0}".format(Piece(piece_type, self.turn)))
+        self.incremental_zobrist_hash ^= self.zobrist_array[zobrist_hand_index(color, piece_type, p[piece_type])]
+        p[piece_type] -= 1
 
     def has_piece_in_hand(self, piece_type, color):
-        if piece_type >= PROM_PAWN:
-            piece_type = PIECE_PROMOTED.index(piece_type)
-        return piece_type in self.pieces_in_hand[color]
+        return self.pieces_in_hand[color][PIECE_UNPROMOTED[piece_type]] > 0
 
     def remove_piece_at(self, square, into_hand=False):
         """Removes a piece from the given square if present."""
@@ -677,6 +1119,9 @@ class Board(object):
         if piece_type == NONE:
             return
 
+        self.check_state = None
+        self.sfen_ranks[rank_index(square)] = None
+
         if into_hand:
             self.add_piece_into_hand(piece_type, self.turn)
 
@@ -694,36 +1139,43 @@ class Board(object):
             piece_index = (piece_type - 1) * 2
         else:
             piece_index = (piece_type - 1) * 2 + 1
-        self.incremental_zobrist_hash ^= DEFAULT_RANDOM_ARRAY[
+        self.incremental_zobrist_hash ^= self.zobrist_array[
             81 * piece_index + 9 * rank_index(square) + file_index(square)
         ]
 
     def set_piece_at(self, square, piece, from_hand=False, into_hand=False):
         """Sets a piece at the given square. An existing piece is replaced."""
+        self.set_piece_type_at(square, piece.piece_type, piece.color, from_hand, into_hand)
+
+    def set_piece_type_at(self, square, piece_type, color, from_hand=False, into_hand=False):
+        """
+        Sets a piece of the given type and color at the given square. An
+        existing piece is replaced.
+        """
         if from_hand:
-            self.remove_piece_from_hand(piece.piece_type, self.turn)
+            self.remove_piece_from_hand(piece_type, self.turn)
 
         self.remove_piece_at(square, into_hand)
 
-        self.pieces[square] = piece.piece_type
+        self.check_state = None
+        self.sfen_ranks[rank_index(square)] = None
+        self.pieces[square] = piece_type
 
         mask = BB_SQUARES[square]
 
-        piece_type = piece.piece_type
-
         self.piece_bb[piece_type] |= mask
 
         if piece_type == KING:
-            self.king_squares[piece.color] = square
+            self.king_squares[color] = square
 
-        self.occupied.ixor(mask, piece.color, square)
+        self.occupied.ixor(mask, color, square)
 
         # Update incremental zorbist hash.
-        if piece.color == BLACK:
-            piece_index = (piece.piece_type - 1) * 2
+        if color == BLACK:
+            piece_index = (piece_type - 1) * 2
         else:
-            piece_index = (piece.piece_type - 1) * 2 + 1
-        self.incremental_zobrist_hash ^= DEFAULT_RANDOM_ARRAY[
+            piece_index = (piece_type - 1) * 2 + 1
+        self.incremental_zobrist_hash ^= self.zobrist_array[
             81 * piece_index + 9 * rank_index(square) + file_index(square)
         ]
 
@@ -750,6 +1202,7 @@ class Board(object):
         golds_drop=True,
         bishops_drop=True,
         rooks_drop=True,
+        packed=False,
     ):
         move_flags = [
             False,
@@ -770,123 +1223,378 @@ class Board(object):
         ]
         drop_flags = [False, pawns_drop, lances_drop, knights_drop, silvers_drop, golds_drop, bishops_drop, rooks_drop]
 
+        return self.generate_moves(move_flags, drop_flags, packed=packed)
+
+    def move_masks(self, move_flags, legal=False, target=BB_ALL):
+        """
+        Yields triples of a piece type enabled in `move_flags`, a square with
+        such a piece of the side to move and the mask of its destinations.
+        If `legal` is set, only legal destinations are included. Unless the
+        king itself moves, destinations are restricted to `target`, which must
+        resolve any check on the king of the side to move.
+        """
+        if legal:
+            king_square = self.king_squares[self.turn]
+            pinned = self.pinned_mask(self.turn)
+
         for piece_type in PIECE_TYPES:
-            # piece move
-            if move_flags[piece_type]:
+            if move_flags[piece_type] and (target or piece_type == KING):
                 movers = self.piece_bb[piece_type] & self.occupied[self.turn]
-                from_square = bit_scan(movers)
-
-                while from_square != -1 and from_square is not None:
+                for from_square in scan_forward(movers):
                     moves = (
                         Board.attacks_from(piece_type, from_square, self.occupied, self.turn)
                         & ~self.occupied[self.turn]
                     )
-                    to_square = bit_scan(moves)
-                    while to_square != -1 and to_square is not None:
-                        if can_move_without_promotion(to_square, piece_type, self.turn):
-                            yield Move(from_square, to_square)
-                        if can_promote(from_square, piece_type, self.turn) or can_promote(
-                            to_square, piece_type, self.turn
+                    if legal:
+                        if from_square == king_square:
+                            moves &= ~self.king_danger_mask(moves)
+                        else:
+                            moves &= target
+                            if BB_SQUARES[from_square] & pinned:
+                                moves &= BB_LINES[king_square][from_square]
+                    yield piece_type, from_square, moves
+
+    def drop_masks(self, drop_flags, legal=False, target=BB_ALL):
+        """
+        Yields pairs of a piece type enabled in `drop_flags` the side to move
+        has in hand and the mask of squares it can be dropped on.
+        If `legal` is set, pawn drop mates are excluded. Destinations are
+        restricted to `target`.
+        """
+        empty = self.occupied.non_occupied() & target
+
+        for piece_type in range(PAWN, KING):
+            if drop_flags[piece_type] and self.has_piece_in_hand(piece_type, self.turn):
+                moves = empty & ~BB_MUST_PROMOTE[self.turn][piece_type]
+
+                if piece_type == PAWN:
+                    pawns = self.piece_bb[PAWN] & self.occupied[self.turn]
+                    for file_mask in BB_FILES:
+                        if pawns & file_mask:
+                            moves &= ~file_mask
+
+                    # Only a pawn dropped right in front of the king can be a
+                    # pawn drop mate.
+                    enemy_king_square = self.king_squares[self.turn ^ 1]
+                    if legal and enemy_king_square is not None:
+                        mate_mask = moves & BB_PAWN_ATTACKS[self.turn ^ 1][enemy_king_square]
+                        if mate_mask and self.is_check_by_dropping_pawn(
+                            pack_move(None, bit_scan(mate_mask), False, PAWN)
                         ):
-                            yield Move(from_square, to_square, True)
-                        to_square = bit_scan(moves, to_square + 1)
-                    from_square = bit_scan(movers, from_square + 1)
+                            moves &= ~mate_mask
+
+                yield piece_type, moves
+
+    def generate_moves(
+        self,
+        move_flags,
+        drop_flags,
+        legal=False,
+        target=BB_ALL,
+        packed=False,
+        destinations=BB_ALL,
+        checks=False,
+        promotions_only=False,
+    ):
+        """
+        Generates moves of the piece types enabled in `move_flags` and drops of
+        the piece types enabled in `drop_flags`.
+        If `legal` is set, only legal moves are generated. Unless the king
+        itself moves, destinations are restricted to `target`, which must
+        resolve any check on the king of the side to move.
+        If `packed` is set, packed moves are generated instead of `Move`
+        objects.
+        The moves can further be restricted to the squares in `destinations`,
+        to moves giving check (`checks`) and to promotions (`promotions_only`).
+        """
+        make_move = pack_move if packed else Move
+
+        if checks:
+            enemy_king_square = self.king_squares[self.turn ^ 1]
+            if enemy_king_square is None:
+                return
+
+            # Squares a piece of each type gives check from and pieces giving
+            # a discovered check by moving off their line to the king.
+            check_squares = [
+                Board.attacks_from(piece_type, enemy_king_square, self.occupied, self.turn ^ 1)
+                for piece_type in PIECE_TYPES_WITH_NONE
+            ]
+            discoverers = self.discoverer_mask()
+
+        for piece_type, from_square, moves in self.move_masks(move_flags, legal, target):
+            moves &= destinations
+
+            # Split the destinations into the ones without and with promotion.
+            unpromoted = moves & ~BB_MUST_PROMOTE[self.turn][piece_type]
+            zone = BB_CAN_PROMOTE[self.turn][piece_type]
+            if BB_SQUARES[from_square] & zone:
+                promoted = moves
+            else:
+                promoted = moves & zone
+
+            if promotions_only:
+                unpromoted = BB_VOID
+            if checks:
+                if BB_SQUARES[from_square] & discoverers:
+                    discovered = ~BB_LINES[enemy_king_square][from_square]
+                else:
+                    discovered = BB_VOID
+                unpromoted &= check_squares[piece_type] | discovered
+                if promoted:
+                    promoted &= check_squares[PIECE_PROMOTED[piece_type]] | discovered
+
+            for to_square in scan_forward(unpromoted | promoted):
+                to_mask = BB_SQUARES[to_square]
+                if unpromoted & to_mask:
+                    yield make_move(from_square, to_square)
+                if promoted & to_mask:
+                    yield make_move(from_square, to_square, True)
+
+        if promotions_only:
+            return
 
         # Drop pieces in hand.
-        moves = self.occupied.non_occupied()
-        to_square = bit_scan(moves)
-
-        while to_square != -1 and to_square is not None:
-            for piece_type in range(PAWN, KING):
-                # Check having the piece in hand, can move after place
-                # and double pawn
-                if (
-                    drop_flags[piece_type]
-                    and self.has_piece_in_hand(piece_type, self.turn)
-                    and can_move_without_promotion(to_square, piece_type, self.turn)
-                    and not self.is_double_pawn(to_square, piece_type)
-                ):
-                    yield Move(None, to_square, False, piece_type)
-
-            to_square = bit_scan(moves, to_square + 1)
+        for piece_type, moves in self.drop_masks(drop_flags, legal, target & destinations):
+            if checks:
+                moves &= check_squares[piece_type]
+            for to_square in scan_forward(moves):
+                yield make_move(None, to_square, False, piece_type)
+
+    def generate_captures(self, legal=True, packed=False):
+        """
+        Generates the moves capturing a piece, legal ones unless `legal` is
+        unset.
+        """
+        return self.generate_moves(
+            ALL_MOVE_FLAGS,
+            NO_DROP_FLAGS,
+            legal=legal,
+            target=self.evasion_mask() if legal else BB_ALL,
+            packed=packed,
+            destinations=self.occupied[self.turn ^ 1],
+        )
+
+    def generate_non_captures(self, legal=True, packed=False):
+        """
+        Generates the moves to empty squares and drops, legal ones unless
+        `legal` is unset.
+        """
+        return self.generate_moves(
+            ALL_MOVE_FLAGS,
+            ALL_DROP_FLAGS,
+            legal=legal,
+            target=self.evasion_mask() if legal else BB_ALL,
+            packed=packed,
+            destinations=self.occupied.non_occupied(),
+        )
+
+    def generate_checks(self, legal=True, packed=False):
+        """
+        Generates the moves and drops giving check, including discovered
+        checks, legal ones unless `legal` is unset.
+        """
+        return self.generate_moves(
+            ALL_MOVE_FLAGS,
+            ALL_DROP_FLAGS,
+            legal=legal,
+            target=self.evasion_mask() if legal else BB_ALL,
+            packed=packed,
+            checks=True,
+        )
+
+    def generate_promotions(self, legal=True, packed=False):
+        """
+        Generates the promoting moves, legal ones unless `legal` is unset.
+        """
+        return self.generate_moves(
+            ALL_MOVE_FLAGS,
+            NO_DROP_FLAGS,
+            legal=legal,
+            target=self.evasion_mask() if legal else BB_ALL,
+            packed=packed,
+            promotions_only=True,
+        )
 
     def is_attacked_by(self, color, square, piece_types=PIECE_TYPES):
         if square is None:
             return False
 
-        for piece_type in piece_types:
-            is_attacked = (
-                Board.attacks_from(piece_type, square, self.occupied, color ^ 1)
-                & self.piece_bb[piece_type]
-                & self.occupied[color]
-            )
-            if is_attacked:
-                return True
+        attackers = self.attacker_mask(color, square)
+        if attackers and piece_types is not PIECE_TYPES:
+            pieces = BB_VOID
+            for piece_type in piece_types:
+                pieces |= self.piece_bb[piece_type]
+            attackers &= pieces
 
-        return False
+        return bool(attackers)
 
     def attacker_mask(self, color, square):
-        attackers = BB_VOID
-        for piece_type in PIECE_TYPES:
-            attackers |= Board.attacks_from(piece_type, square, self.occupied, color ^ 1) & self.piece_bb[piece_type]
-        return attackers & self.occupied[color]
+        """
+        Gets a mask of the pieces of the given side attacking the square.
+        The attacks are looked up in reverse from the attacked square, so
+        pieces moving alike are checked at once.
+        """
+        occupied = self.occupied
+        piece_bb = self.piece_bb
+        reverse = color ^ 1
+        kings = piece_bb[KING] | piece_bb[PROM_BISHOP] | piece_bb[PROM_ROOK]
+        golds = (
+            piece_bb[GOLD] | piece_bb[PROM_PAWN] | piece_bb[PROM_LANCE] | piece_bb[PROM_KNIGHT] | piece_bb[PROM_SILVER]
+        )
+        rook_attacks = occupied.rook_attacks(square)
+
+        attackers = (
+            (BB_PAWN_ATTACKS[reverse][square] & piece_bb[PAWN])
+            | (BB_KNIGHT_ATTACKS[reverse][square] & piece_bb[KNIGHT])
+            | (BB_SILVER_ATTACKS[reverse][square] & (piece_bb[SILVER] | kings))
+            | (BB_GOLD_ATTACKS[reverse][square] & (golds | kings))
+            | (rook_attacks & (piece_bb[ROOK] | piece_bb[PROM_ROOK]))
+            | (rook_attacks & BB_LANCE_ATTACKS[reverse][square][0] & piece_bb[LANCE])
+            | (occupied.bishop_attacks(square) & (piece_bb[BISHOP] | piece_bb[PROM_BISHOP]))
+        )
+        return attackers & occupied[color]
 
     def attackers(self, color, square):
         return SquareSet(self.attacker_mask(color, square))
 
+    def king_danger_mask(self, squares):
+        """
+        Gets the subset of `squares` the king of the side to move can not go
+        to, because they are attacked once the king has left its square.
+        """
+        king_square = self.king_squares[self.turn]
+        king_mask = BB_SQUARES[king_square]
+        danger = BB_VOID
+
+        # Lift the king so that it does not block sliders attacking through it.
+        self.occupied.ixor(king_mask, self.turn, king_square)
+        try:
+            for square in scan_forward(squares):
+                if self.is_attacked_by(self.turn ^ 1, square):
+                    danger |= BB_SQUARES[square]
+        finally:
+            self.occupied.ixor(king_mask, self.turn, king_square)
+
+        return danger
+
+    def pins(self, color):
+        """
+        Yields pairs of a square holding a piece of the given side that is
+        pinned to its king and the mask of squares the piece can move to
+        without exposing the king (the squares up to and including the
+        pinning piece).
+        """
+        return self.blockers(color, color)
+
+    def blockers(self, king_color, color):
+        """
+        Yields pairs of a square holding the only piece between the king of
+        `king_color` and a sliding piece of the other side, if the piece
+        belongs to `color`, and the squares up to and including the sliding
+        piece.
+        """
+        king_square = self.king_squares[king_color]
+        if king_square is None:
+            return
+
+        snipers = self.occupied[king_color ^ 1] & (
+            (BB_ROOK_RAYS[king_square] & (self.piece_bb[ROOK] | self.piece_bb[PROM_ROOK]))
+            | (BB_BISHOP_RAYS[king_square] & (self.piece_bb[BISHOP] | self.piece_bb[PROM_BISHOP]))
+            | (BB_LANCE_ATTACKS[king_color][king_square][0] & self.piece_bb[LANCE])
+        )
+
+        for sniper in scan_forward(snipers):
+            between = BB_BETWEEN[king_square][sniper]
+            blockers = between & self.occupied.bits
+            # Exactly one blocker and it belongs to the given side.
+            if blockers and not blockers & (blockers - 1) and blockers & self.occupied[color]:
+                yield bit_scan(blockers), between | BB_SQUARES[sniper]
+
+    def discoverer_mask(self):
+        """
+        Gets a mask of the pieces of the side to move giving a discovered
+        check when moving off their line to the king of the other side.
+        """
+        discoverers = BB_VOID
+        for square, _ in self.blockers(self.turn ^ 1, self.turn):
+            discoverers |= BB_SQUARES[square]
+        return discoverers
+
+    def pinned_mask(self, color):
+        """Gets a mask of the pieces of the given side pinned to their king."""
+        if color == self.turn:
+            return self.current_check_state()[2]
+
+        pinned = BB_VOID
+        for square, _ in self.pins(color):
+            pinned |= BB_SQUARES[square]
+        return pinned
+
+    def pin_mask(self, color, square):
+        """
+        Gets the mask of squares the piece on the given square can move to
+        without exposing the king of the given side. `BB_ALL` if the piece is
+        not pinned.
+        """
+        for pinned_square, ray in self.pins(color):
+            if pinned_square == square:
+                return ray
+        return BB_ALL
+
+    def pin(self, color, square):
+        return SquareSet(self.pin_mask(color, square))
+
+    def is_pinned(self, color, square):
+        return self.pin_mask(color, square) != BB_ALL
+
+    def current_check_state(self):
+        """
+        Gets a triple of the side to move, the mask of the pieces giving check
+        to it and the mask of its pieces pinned to its king. It is computed
+        once per position and kept in the stack on push, so pop restores it.
+        """
+        check_state = self.check_state
+        if check_state is None or check_state[0] != self.turn:
+            king_square = self.king_squares[self.turn]
+            if king_square is None:
+                checkers = BB_VOID
+            else:
+                checkers = self.attacker_mask(self.turn ^ 1, king_square)
+
+            pinned = BB_VOID
+            for square, _ in self.pins(self.turn):
+                pinned |= BB_SQUARES[square]
+
+            check_state = self.check_state = (self.turn, checkers, pinned)
+        return check_state
+
+    def checker_mask(self):
+        """Gets a mask of the pieces giving check to the side to move."""
+        return self.current_check_state()[1]
+
+    def checkers(self):
+        return SquareSet(self.checker_mask())
+
     def is_check(self):
-        return self.is_attacked_by(self.turn ^ 1, self.king_squares[self.turn])
+        return bool(self.current_check_state()[1])
 
     @staticmethod
     def attacks_from(piece_type, square, occupied, move_color):
-        if piece_type == NONE:
-            return BB_VOID
-        if piece_type == PAWN:
-            return BB_PAWN_ATTACKS[move_color][square]
-        elif piece_type == LANCE:
-            return BB_LANCE_ATTACKS[move_color][square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127]
-        elif piece_type == KNIGHT:
-            return BB_KNIGHT_ATTACKS[move_color][square]
-        elif piece_type == SILVER:
-            return BB_SILVER_ATTACKS[move_color][square]
-        elif piece_type in [GOLD, PROM_PAWN, PROM_LANCE, PROM_KNIGHT, PROM_SILVER]:
-            return BB_GOLD_ATTACKS[move_color][square]
-        elif piece_type == BISHOP:
-            return (
-                BB_R45_ATTACKS[square][(occupied.r45 >> BB_SHIFT_R45[square]) & 127]
-                | BB_L45_ATTACKS[square][(occupied.l45 >> BB_SHIFT_L45[square]) & 127]
-            )
-        elif piece_type == ROOK:
-            return (
-                BB_RANK_ATTACKS[square][(occupied.bits >> (((square // 9) * 9) + 1)) & 127]
-                | BB_FILE_ATTACKS[square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127]
-            )
-        elif piece_type == KING:
-            return BB_KING_ATTACKS[square]
-        elif piece_type == PROM_BISHOP:
-            return (
-                BB_KING_ATTACKS[square]
-                | BB_R45_ATTACKS[square][(occupied.r45 >> BB_SHIFT_R45[square]) & 127]
-                | BB_L45_ATTACKS[square][(occupied.l45 >> BB_SHIFT_L45[square]) & 127]
-            )
-        elif piece_type == PROM_ROOK:
-            return (
-                BB_KING_ATTACKS[square]
-                | BB_RANK_ATTACKS[square][(occupied.bits >> (((square // 9) * 9) + 1)) & 127]
-                | BB_FILE_ATTACKS[square][(occupied.l90 >> (((square % 9) * 9) + 1)) & 127]
-            )
+        return PIECE_ATTACKS[piece_type](square, occupied, move_color)
 
     def is_suicide_or_check_by_dropping_pawn(self, move):
         """
         Checks if the given move would move would leave the king in check or
-        put it into check.
+        is a pawn drop mate.
         """
+        if self.is_check_by_dropping_pawn(move):
+            return True
 
         self.push(move)
         is_suicide = self.was_suicide()
-        is_check_by_dropping_pawn = self.was_check_by_dropping_pawn(move)
         self.pop()
-        return is_suicide or is_check_by_dropping_pawn
+        return is_suicide
 
     def was_suicide(self):
         """
@@ -896,38 +1604,76 @@ class Board(object):
         return self.is_attacked_by(self.turn, self.king_squares[self.turn ^ 1])
 
     def was_check_by_dropping_pawn(self, move):
-        # NOTE: We ignore the case "Saigo no shinpan" (by Koji Nuita, 1997)
-        # We don't use is_checkmate() because it's slow due to generating all leagl moves
-        # And we don't consider suicide of a king.
+        """
+        Checks if the last move was a pawn drop mate, with the pawn already
+        on the board.
+        """
+        _, pawn_square, _, drop_piece_type = unpack_move(move)
+
+        # Pawn is dropped?
+        if drop_piece_type != PAWN:
+            return False
 
-        pawn_square = move.to_square
+        return self.is_mate_by_pawn(self.turn, pawn_square)
+
+    def is_check_by_dropping_pawn(self, move):
+        """
+        Checks if the given move is a pawn drop mate without making it.
+        """
+        _, pawn_square, _, drop_piece_type = unpack_move(move)
 
         # Pawn is dropped?
-        if move.drop_piece_type != PAWN:
+        if drop_piece_type != PAWN:
             return False
 
-        king_square = self.king_squares[self.turn]
+        # Put the pawn onto the occupancy only, it blocks sliders.
+        mask = BB_SQUARES[pawn_square]
+        self.occupied.ixor(mask, self.turn, pawn_square)
+        try:
+            return self.is_mate_by_pawn(self.turn ^ 1, pawn_square)
+        finally:
+            self.occupied.ixor(mask, self.turn, pawn_square)
+
+    def is_mate_by_pawn(self, color, pawn_square):
+        """
+        Checks if the king of the given side is mated by a pawn of the other
+        side on the given square, which must be occupied.
+        """
+        # NOTE: We ignore the case "Saigo no shinpan" (by Koji Nuita, 1997)
+        # We don't use is_checkmate() because it's slow due to generating all leagl moves
+
+        king_square = self.king_squares[color]
 
         # Does king exist?
         if king_square is None:
             return False
 
         # Pawn can capture a king next move?
-        moves = BB_PAWN_ATTACKS[self.turn ^ 1][pawn_square] & ~self.occupied[self.turn ^ 1]
-        if not moves & BB_SQUARES[king_square]:
+        if not BB_PAWN_ATTACKS[color ^ 1][pawn_square] & BB_SQUARES[king_square]:
             return False
 
-        # Can king escape? (including capturing a dropped pawn)
-        moves = Board.attacks_from(KING, king_square, self.occupied, self.turn) & ~self.occupied[self.turn]
-        square = bit_scan(moves)
-        while square != -1 and square is not None:
-            if not self.is_attacked_by(self.turn ^ 1, square):
+        # Pieces besides king can capture the pawn? Pinned pieces can only
+        # capture it along the line of their pin.
+        defenders = self.attacker_mask(color, pawn_square) & ~self.piece_bb[KING]
+        if defenders:
+            pinned = defenders & self.pinned_mask(color)
+            if defenders & ~pinned:
                 return False
-            square = bit_scan(moves, square + 1)
+            for square in scan_forward(pinned):
+                if BB_LINES[king_square][square] & BB_SQUARES[pawn_square]:
+                    return False
 
-        # Pieces besides king can capture the pawn?
-        if self.is_attacked_by(self.turn, pawn_square, PIECE_TYPES_WITHOUT_KING):
-            return False
+        # Can king escape? (including capturing a dropped pawn)
+        # Lift the king so that it does not block sliders attacking through it.
+        moves = BB_KING_ATTACKS[king_square] & ~self.occupied[color]
+        king_mask = BB_SQUARES[king_square]
+        self.occupied.ixor(king_mask, color, king_square)
+        try:
+            for square in scan_forward(moves):
+                if not self.attacker_mask(color ^ 1, square):
+                    return False
+        finally:
+            self.occupied.ixor(king_mask, color, king_square)
 
         return True
 
@@ -948,45 +1694,132 @@ class Board(object):
         golds_drop=True,
         bishops_drop=True,
         rooks_drop=True,
+        packed=False,
     ):
-        return (
-            move
-            for move in self.generate_pseudo_legal_moves(
-                pawns,
-                lances,
-                knights,
-                silvers,
-                golds,
-                bishops,
-                rooks,
-                king,
-                pawns_drop,
-                lances_drop,
-                knights_drop,
-                silvers_drop,
-                golds_drop,
-                bishops_drop,
-                rooks_drop,
-            )
-            if not self.is_suicide_or_check_by_dropping_pawn(move)
-        )
+        move_flags = [
+            False,
+            pawns,
+            lances,
+            knights,
+            silvers,
+            golds,
+            bishops,
+            rooks,
+            king,
+            True,
+            True,
+            True,
+            True,
+            True,
+            True,
+        ]
+        drop_flags = [False, pawns_drop, lances_drop, knights_drop, silvers_drop, golds_drop, bishops_drop, rooks_drop]
+
+        if self.is_check():
+            return self.generate_evasions(move_flags, drop_flags, packed)
+
+        return self.generate_moves(move_flags, drop_flags, legal=True, packed=packed)
+
+    def count_moves(self, move_flags, drop_flags, legal=False, target=BB_ALL):
+        """
+        Counts the moves generate_moves() would generate with the same
+        arguments without creating them.
+        """
+        count = 0
+
+        for piece_type, from_square, moves in self.move_masks(move_flags, legal, target):
+            zone = BB_CAN_PROMOTE[self.turn][piece_type]
+            if not zone:
+                count += pop_count(moves)
+            else:
+                count += pop_count(moves & ~BB_MUST_PROMOTE[self.turn][piece_type])
+                if BB_SQUARES[from_square] & zone:
+                    count += pop_count(moves)
+                else:
+                    count += pop_count(moves & zone)
+
+        for piece_type, moves in self.drop_masks(drop_flags, legal, target):
+            count += pop_count(moves)
+
+        return count
+
+    def count_pseudo_legal_moves(self):
+        return self.count_moves(ALL_MOVE_FLAGS, ALL_DROP_FLAGS)
+
+    def count_legal_moves(self):
+        return self.count_moves(ALL_MOVE_FLAGS, ALL_DROP_FLAGS, legal=True, target=self.evasion_mask())
+
+    def perft(self, depth):
+        """
+        Counts the leaf nodes of the tree of legal moves of the given depth.
+        The moves of the last ply are counted without generating them.
+        """
+        if depth < 1:
+            return 1
+        if depth == 1:
+            return self.count_legal_moves()
+
+        count = 0
+        for move in self.generate_legal_moves(packed=True):
+            self.push(move)
+            count += self.perft(depth - 1)
+            self.pop()
+        return count
+
+    def evasion_mask(self):
+        """
+        Gets the mask of squares a piece besides the king of the side to move
+        has to move to or be dropped on in order to resolve a check.
+        `BB_ALL` if not in check, `BB_VOID` in double check.
+        """
+        checkers = self.checker_mask()
+        if not checkers:
+            return BB_ALL
+        if checkers & (checkers - 1):
+            return BB_VOID
+        return checkers | BB_BETWEEN[self.king_squares[self.turn]][bit_scan(checkers)]
+
+    def generate_evasions(self, move_flags=ALL_MOVE_FLAGS, drop_flags=ALL_DROP_FLAGS, packed=False):
+        """
+        Generates legal moves of the side to move when it is in check: king
+        moves, captures of a single checker and interpositions between a
+        sliding checker and the king.
+        """
+        return self.generate_moves(move_flags, drop_flags, legal=True, target=self.evasion_mask(), packed=packed)
 
     def is_pseudo_legal(self, move):
         # Null moves are not pseudo legal.
         if not move:
             return False
 
+        # Packed moves are not validated when unpacked. Bits that unpacking
+        # ignores, like the promotion bit of a drop, make them invalid.
+        if isinstance(move, numbers.Integral) and (
+            not 0 < move < PACKED_MOVES or pack_move(*unpack_move(move)) != move
+        ):
+            return False
+
+        from_square, to_square, promotion, drop_piece_type = unpack_move(move)
+
+        if to_square is None or not 0 <= to_square < 81:
+            return False
+        if from_square is None:
+            if drop_piece_type is None or not PAWN <= drop_piece_type < KING:
+                return False
+        elif not 0 <= from_square < 81:
+            return False
+
         # Get square masks of the move destination.
-        to_mask = BB_SQUARES[move.to_square]
+        to_mask = BB_SQUARES[to_square]
 
         # Destination square can not be occupied by self.
         if self.occupied[self.turn] & to_mask:
             return False
 
-        if move.from_square is not None:
-            from_mask = BB_SQUARES[move.from_square]
+        if from_square is not None:
+            from_mask = BB_SQUARES[from_square]
             # Source square must not be vacant.
-            piece = self.piece_type_at(move.from_square)
+            piece = self.piece_type_at(from_square)
             if not piece:
                 return False
             # Check turn.
@@ -994,35 +1827,35 @@ class Board(object):
                 return False
 
             # Promotion check
-            if move.promotion:
-                if piece == GOLD or piece == KING or piece >= PROM_PAWN:
-                    return False
-                if self.turn == BLACK and rank_index(move.to_square) > 2 and rank_index(move.from_square) > 2:
-                    return False
-                elif self.turn == WHITE and rank_index(move.to_square) < 6 and rank_index(move.from_square) < 6:
+            if promotion:
+                if not BB_CAN_PROMOTE[self.turn][piece] & (from_mask | to_mask):
                     return False
 
             # Can move without promotion
-            if not move.promotion and not can_move_without_promotion(move.to_square, piece, self.turn):
+            elif BB_MUST_PROMOTE[self.turn][piece] & to_mask:
                 return False
 
             # Handle moves by piece type.
-            return bool(Board.attacks_from(piece, move.from_square, self.occupied, self.turn) & to_mask)
-        elif move.drop_piece_type:
+            return bool(Board.attacks_from(piece, from_square, self.occupied, self.turn) & to_mask)
+        elif drop_piece_type:
             # Cannot set promoted piece
-            if move.promotion:
+            if promotion:
+                return False
+
+            # Can only drop on an empty square
+            if self.occupied.bits & to_mask:
                 return False
 
             # Have a piece in hand
-            if not self.has_piece_in_hand(move.drop_piece_type, self.turn):
+            if not self.has_piece_in_hand(drop_piece_type, self.turn):
                 return False
 
             # Can move without promotion
-            if not can_move_without_promotion(move.to_square, move.drop_piece_type, self.turn):
+            if BB_MUST_PROMOTE[self.turn][drop_piece_type] & to_mask:
                 return False
 
             # Not double pawn
-            if self.is_double_pawn(move.to_square, move.drop_piece_type):
+            if self.is_double_pawn(to_square, drop_piece_type):
                 return False
 
             return True
@@ -1033,6 +1866,80 @@ class Board(object):
     def is_legal(self, move):
         return self.is_pseudo_legal(move) and not self.is_suicide_or_check_by_dropping_pawn(move)
 
+    def filter_legal(self, moves):
+        """
+        Gets the legal moves among the given `Move` objects or packed moves,
+        in the given order. The legal moves of the position are generated once
+        instead of validating each move.
+        """
+        legal_moves = set(self.generate_legal_moves(packed=True))
+        return [move for move in moves if packed_move(move) in legal_moves]
+
+    def filter_legal_mask(self, moves):
+        """
+        Gets a list of flags telling if each of the given `Move` objects or
+        packed moves is legal.
+        """
+        legal_moves = set(self.generate_legal_moves(packed=True))
+        return [packed_move(move) in legal_moves for move in moves]
+
+    def legal_move_mask(self, out=None):
+        """
+        Gets a mask indexed by move indices (see `Move.index()`), which is set
+        for the legal moves of the position. The mask is filled straight from
+        the bitboards of the generator.
+        `out` can be a preallocated NumPy array, `array.array("B")` or
+        bytearray of `MOVE_INDICES` entries, which is cleared and filled.
+        Otherwise a new NumPy array of booleans is returned, or an
+        `array.array("B")` if NumPy is not installed.
+        """
+        if out is None:
+            # NumPy is only imported here to keep importing the module fast.
+            try:
+                import numpy
+            except ImportError:
+                out = array.array("B", bytes(MOVE_INDICES))
+            else:
+                out = numpy.zeros(MOVE_INDICES, dtype=bool)
+        elif hasattr(out, "fill"):
+            # A NumPy array.
+            out.fill(0)
+        else:
+            out[:] = array.array("B", bytes(len(out)))
+
+        target = self.evasion_mask()
+
+        for piece_type, from_square, moves in self.move_masks(ALL_MOVE_FLAGS, True, target):
+            unpromoted = moves & ~BB_MUST_PROMOTE[self.turn][piece_type]
+            zone = BB_CAN_PROMOTE[self.turn][piece_type]
+            if BB_SQUARES[from_square] & zone:
+                promoted = moves
+            else:
+                promoted = moves & zone
+
+            base = from_square * 162
+            for to_square in scan_forward(unpromoted):
+                out[base + to_square * 2] = 1
+            for to_square in scan_forward(promoted):
+                out[base + to_square * 2 + 1] = 1
+
+        for piece_type, moves in self.drop_masks(ALL_DROP_FLAGS, True, target):
+            base = (80 + piece_type) * 162
+            for to_square in scan_forward(moves):
+                out[base + to_square * 2] = 1
+
+        return out
+
+    def legal_move_flags(self):
+        """
+        Gets a bytearray indexed by packed moves, holding 1 for the legal
+        moves of the position and 0 otherwise.
+        """
+        flags = bytearray(PACKED_MOVES)
+        for move in self.generate_legal_moves(packed=True):
+            flags[move] = 1
+        return flags
+
     def is_game_over(self):
         """
         Checks if the game is over due to checkmate, stalemate or
@@ -1040,9 +1947,7 @@ class Board(object):
         """
 
         # Stalemate or checkmate.
-        try:
-            next(self.generate_legal_moves().__iter__())
-        except StopIteration:
+        if not self.has_legal_moves():
             return True
 
         # Fourfold repetition.
@@ -1056,36 +1961,87 @@ class Board(object):
         if not self.is_check():
             return False
 
-        try:
-            next(self.generate_legal_moves().__iter__())
-            return False
-        except StopIteration:
-            return True
+        return not self.has_legal_moves()
 
     def is_stalemate(self):
         """Checks if the current position is a stalemate."""
         if self.is_check():
             return False
 
-        try:
-            next(self.generate_legal_moves().__iter__())
-            return False
-        except StopIteration:
+        return not self.has_legal_moves()
+
+    def has_legal_moves(self):
+        """Checks if the side to move has any legal move."""
+        for move in self.generate_legal_moves(packed=True):
             return True
+        return False
 
     def is_fourfold_repetition(self):
         """
         a game is ended if a position occurs for the fourth time
         on consecutive alternating moves.
         """
-        zobrist_hash = self.zobrist_hash()
+        return self.repetition_start() is not None
 
-        # A minimum amount of moves must have been played and the position
-        # in question must have appeared at least four times.
-        if self.transpositions[zobrist_hash] < 4:
-            return False
+    def repetition_start(self, count=4):
+        """
+        Gets the ply of the first of the last `count` occurrences of the
+        current position in the hash history, or `None` if the position did
+        not occur `count` times.
+        """
+        history = self.hash_history
+        zobrist_hash = history[-1]
 
-        return True
+        # Shogi has no irreversible moves, so all positions since the position
+        # was set are scanned. A position can repeat at the earliest after four
+        # plies and only with the same side to move.
+        for ply in range(len(history) - 5, -1, -2):
+            if history[ply] == zobrist_hash:
+                count -= 1
+                if count == 1:
+                    return ply
+
+        return None
+
+    def check_history(self, ply=0):
+        """
+        Gets a list of whether the side to move was in check in each position
+        from the given ply on, including the current position. The check
+        states saved in the undo records of the move stack are used, and the
+        missing ones are computed on a copy of the board.
+        """
+        checks = [None if record[2] is None else bool(record[2][1]) for record in self.stack[ply:]]
+        checks.append(self.is_check())
+
+        if None in checks:
+            board = self.copy()
+            for i in range(len(checks) - 2, checks.index(None) - 1, -1):
+                board.pop()
+                if checks[i] is None:
+                    checks[i] = board.is_check()
+
+        return checks
+
+    def perpetual_check_color(self):
+        """
+        Gets the color of the side that gave check with every move since the
+        first of the four occurrences of the current position, or `None`.
+        The side giving perpetual check loses instead of the fourfold
+        repetition being a draw.
+        """
+        start = self.repetition_start()
+        if start is None:
+            return None
+
+        checks = self.check_history(start)
+        for color in COLORS:
+            # The positions after the moves of `color`. The first position is
+            # the same as the current one.
+            first = 1 if self.turn == color else 2
+            if all(checks[first::2]):
+                return color
+
+        return None
 
     def is_double_pawn(self, to_square, piece_type):
         if piece_type != PAWN:
@@ -1129,122 +2085,121 @@ class Board(object):
         Updates the position with the given move and puts it onto a stack.
         Null moves just increment the move counters, switch turns and forfeit
         en passant capturing.
+        The move can also be a packed move, see `Move.packed()`.
         No validation is performed. For performance moves are assumed to be at
         least pseudo legal. Otherwise there is no guarantee that the previous
         board state can be restored. To check it yourself you can use:
         >>> move in board.pseudo_legal_moves
         True
         """
+        from_square, to_square, promotion, drop_piece_type = unpack_move(move)
+
         # Increment move number.
         self.move_number += 1
 
         # Remember game state.
-        captured_piece = self.piece_type_at(move.to_square) if move else NONE
-        self.captured_piece_stack.append(captured_piece)
-        self.move_stack.append(move)
+        captured_piece = self.piece_type_at(to_square) if move else NONE
+        self.stack.append((move, captured_piece, self.check_state))
 
         # On a null move simply swap turns.
         if not move:
             self.turn ^= 1
+            self.incremental_zobrist_hash ^= self.zobrist_array[ZOBRIST_TURN_INDEX]
+            self.hash_history.append(self.incremental_zobrist_hash)
             return
 
-        if move.drop_piece_type:
+        if drop_piece_type:
             # Drops.
-            piece_type = move.drop_piece_type
+            piece_type = drop_piece_type
             from_hand = True
         else:
             # Promotion.
-            piece_type = self.piece_type_at(move.from_square)
+            piece_type = self.piece_type_at(from_square)
             from_hand = False
 
-            if move.promotion:
+            if promotion:
                 piece_type = PIECE_PROMOTED[piece_type]
 
             # Remove piece from target square.
-            self.remove_piece_at(move.from_square, False)
+            self.remove_piece_at(from_square, False)
 
         # Put piece on target square.
-        self.set_piece_at(move.to_square, Piece(piece_type, self.turn), from_hand, True)
+        self.set_piece_type_at(to_square, piece_type, self.turn, from_hand, True)
 
         # Swap turn.
         self.turn ^= 1
+        self.incremental_zobrist_hash ^= self.zobrist_array[ZOBRIST_TURN_INDEX]
 
-        # Update transposition table.
-        self.transpositions.update((self.zobrist_hash(),))
+        # Update the hash history.
+        self.hash_history.append(self.incremental_zobrist_hash)
 
     def pop(self):
         """
         Restores the previous position and returns the last move from the stack.
         """
-        move = self.move_stack.pop()
+        move, captured_piece_type, check_state = self.stack.pop()
 
-        # Update transposition table.
-        self.transpositions.subtract((self.zobrist_hash(),))
+        # Update the hash history.
+        self.hash_history.pop()
 
         # Decrement move number.
         self.move_number -= 1
 
         # Restore state.
-        captured_piece_type = self.captured_piece_stack.pop()
         captured_piece_color = self.turn
 
         # On a null move simply swap the turn.
         if not move:
             self.turn ^= 1
+            self.incremental_zobrist_hash ^= self.zobrist_array[ZOBRIST_TURN_INDEX]
+            self.check_state = check_state
             return move
 
+        from_square, to_square, promotion, drop_piece_type = unpack_move(move)
+
         # Restore the source square.
-        piece_type = self.piece_type_at(move.to_square)
-        if move.promotion:
-            piece_type = PIECE_PROMOTED.index(piece_type)
+        piece_type = self.piece_type_at(to_square)
+        if promotion:
+            piece_type = PIECE_UNPROMOTED[piece_type]
 
-        if move.from_square is None:
+        if from_square is None:
             self.add_piece_into_hand(piece_type, self.turn ^ 1)
         else:
-            self.set_piece_at(move.from_square, Piece(piece_type, self.turn ^ 1))
+            self.set_piece_type_at(from_square, piece_type, self.turn ^ 1)
 
         # Restore target square.
         if captured_piece_type:
             self.remove_piece_from_hand(captured_piece_type, captured_piece_color ^ 1)
-            self.set_piece_at(move.to_square, Piece(captured_piece_type, captured_piece_color))
+            self.set_piece_type_at(to_square, captured_piece_type, captured_piece_color)
         else:
-            self.remove_piece_at(move.to_square)
+            self.remove_piece_at(to_square)
 
         # Swap turn.
         self.turn ^= 1
+        self.incremental_zobrist_hash ^= self.zobrist_array[ZOBRIST_TURN_INDEX]
+
+        # The checkers and pinned pieces are the same as before the move.
+        self.check_state = check_state
 
         return move
 
     def peek(self):
         """Gets the last move from the move stack."""
-        return self.move_stack[-1]
+        return self.stack[-1][0]
 
     def sfen(self):
         """
         Gets an SFEN representation of the current position.
         """
         sfen = []
-        empty = 0
 
-        # Position part.
-        for square in SQUARES:
-            piece = self.piece_at(square)
-
-            if not piece:
-                empty += 1
-            else:
-                if empty:
-                    sfen.append(str(empty))
-                    empty = 0
-                sfen.append(piece.symbol())
-
-            if BB_SQUARES[square] & BB_FILE_1:
-                if empty:
-                    sfen.append(str(empty))
-                    empty = 0
-
-                if square != I1:
-                    sfen.append("/")
+        # Position part. The ranks are cached until a square of them changes.
+        for rank in range(9):
+            rank_sfen = self.sfen_ranks[rank]
+            if rank_sfen is None:
+                rank_sfen = self.sfen_ranks[rank] = self.rank_sfen(rank)
+            sfen.append(rank_sfen)
+        sfen = ["/".join(sfen)]
 
         sfen.append(" ")
 
@@ -1260,13 +2215,12 @@ class Board(object):
         pih_len = 0
         for color in COLORS:
             p = self.pieces_in_hand[color]
-            pih_len += len(p)
-            for piece_type in sorted(p.keys(), reverse=True):
+            for piece_type in HAND_PIECE_TYPES:
                 if p[piece_type] >= 1:
+                    pih_len += 1
                     if p[piece_type] > 1:
                         sfen.append(str(p[piece_type]))
-                    piece = Piece(piece_type, color)
-                    sfen.append(piece.symbol())
+                    sfen.append(SFEN_PIECE_SYMBOLS[color][piece_type])
         if pih_len == 0:
             sfen.append("-")
 
@@ -1277,6 +2231,156 @@ class Board(object):
 
         return "".join(sfen)
 
+    def to_packed(self):
+        """
+        Packs the position into 32 bytes (see `PACKED_POSITION_SIZE`).
+        Raises `ValueError` if the position does not have exactly the 40
+        pieces of a game.
+        """
+        if packed_piece_counts(self.pieces, self.pieces_in_hand) != PACKED_PIECE_COUNTS:
+            raise ValueError("only positions with all 40 pieces can be packed: {0}".format(repr(self.sfen())))
+
+        bits = self.turn | PACKED_SQUARES[self.king_squares[BLACK]] << 1 | PACKED_SQUARES[self.king_squares[WHITE]] << 8
+        cursor = 15
+        white = self.occupied[WHITE]
+
+        for square in PACKED_SQUARES_INVERSE:
+            piece_type = self.pieces[square]
+            if piece_type == KING:
+                continue
+            unpromoted = PIECE_UNPROMOTED[piece_type]
+            code, length = PACKED_PIECE_CODES[unpromoted]
+            bits |= code << cursor
+            cursor += length
+            if piece_type:
+                if unpromoted != GOLD:
+                    bits |= (piece_type != unpromoted) << cursor
+                    cursor += 1
+                bits |= ((white >> square) & 1) << cursor
+                cursor += 1
+
+        for color in COLORS:
+            for piece_type in PACKED_HAND_PIECE_TYPES:
+                code, length = PACKED_PIECE_CODES[piece_type]
+                # The code without its first bit, the promotion bit and the color bit.
+                if piece_type != GOLD:
+                    code, length = (code >> 1) | color << length, length + 1
+                else:
+                    code, length = (code >> 1) | color << (length - 1), length
+                for i in range(self.pieces_in_hand[color][piece_type]):
+                    bits |= code << cursor
+                    cursor += length
+
+        return bits.to_bytes(PACKED_POSITION_SIZE, "little")
+
+    def set_packed(self, packed, move_number=1):
+        """
+        Sets the position from 32 bytes packed by `to_packed()`.
+        Raises `ValueError` if the data is invalid, leaving the board
+        unchanged.
+        """
+        if len(packed) != PACKED_POSITION_SIZE:
+            raise ValueError("expected {0} bytes of a packed position".format(PACKED_POSITION_SIZE))
+
+        bits = int.from_bytes(packed, "little")
+
+        turn = bits & 1
+        king_squares = [(bits >> 1) & 127, (bits >> 8) & 127]
+        if king_squares[BLACK] == king_squares[WHITE] or max(king_squares) >= 81:
+            raise ValueError("invalid king squares in packed position")
+        king_squares = [PACKED_SQUARES_INVERSE[square] for square in king_squares]
+        bits >>= 15
+        cursor = 15
+
+        # Decode everything before changing the board.
+        pieces = [NONE for square in SQUARES]
+        colors = [BLACK for square in SQUARES]
+        for color in COLORS:
+            pieces[king_squares[color]] = KING
+            colors[king_squares[color]] = color
+
+        for square in PACKED_SQUARES_INVERSE:
+            if pieces[square] == KING:
+                continue
+            piece_type, length = PACKED_BOARD_DECODING[bits & 63]
+            bits >>= length
+            cursor += length
+            if piece_type:
+                if piece_type != GOLD:
+                    if bits & 1:
+                        piece_type = PIECE_PROMOTED[piece_type]
+                    bits >>= 1
+                    cursor += 1
+                pieces[square] = piece_type
+                colors[square] = bits & 1
+                bits >>= 1
+                cursor += 1
+
+        pieces_in_hand = [[0] * KING, [0] * KING]
+        while cursor < PACKED_POSITION_SIZE * 8:
+            piece_type, length = PACKED_HAND_DECODING[bits & 31]
+            bits >>= length
+            cursor += length
+            if piece_type != GOLD:
+                # Pieces in hand are not promoted.
+                if bits & 1:
+                    raise ValueError("invalid piece in hand in packed position")
+                bits >>= 1
+                cursor += 1
+            pieces_in_hand[bits & 1][piece_type] += 1
+            bits >>= 1
+            cursor += 1
+
+        if cursor != PACKED_POSITION_SIZE * 8 or packed_piece_counts(pieces, pieces_in_hand) != PACKED_PIECE_COUNTS:
+            raise ValueError("packed position does not have all 40 pieces")
+
+        self.clear()
+
+        for square in SQUARES:
+            if pieces[square]:
+                self.set_piece_type_at(square, pieces[square], colors[square])
+
+        for color in COLORS:
+            for piece_type in HAND_PIECE_TYPES:
+                if pieces_in_hand[color][piece_type]:
+                    self.add_piece_into_hand(piece_type, color, pieces_in_hand[color][piece_type])
+
+        if turn == WHITE:
+            self.turn = WHITE
+            self.incremental_zobrist_hash ^= self.zobrist_array[ZOBRIST_TURN_INDEX]
+        self.move_number = move_number
+        self.hash_history = [self.zobrist_hash()]
+
+    @classmethod
+    def from_packed(cls, packed, move_number=1):
+        """Creates a board from 32 bytes packed by `to_packed()`."""
+        board = cls(None)
+        board.set_packed(packed, move_number)
+        return board
+
+    def rank_sfen(self, rank):
+        """
+        Gets the SFEN representation of the given rank, numbered from 0 for
+        rank "a".
+        """
+        rank_sfen = []
+        empty = 0
+        white = self.occupied[WHITE]
+
+        for square in range(rank * 9, rank * 9 + 9):
+            piece_type = self.pieces[square]
+            if not piece_type:
+                empty += 1
+            else:
+                if empty:
+                    rank_sfen.append(SFEN_EMPTY_SQUARES[empty])
+                    empty = 0
+                rank_sfen.append(SFEN_PIECE_SYMBOLS[(white >> square) & 1][piece_type])
+
+        if empty:
+            rank_sfen.append(SFEN_EMPTY_SQUARES[empty])
+        return "".join(rank_sfen)
+
     def set_sfen(self, sfen):
         """
         Parses a SFEN and sets the position from it.
@@ -1360,11 +2464,9 @@ class Board(object):
         # Set the turn.
         if parts[1] == "w":
             self.turn = WHITE
-        else:
-            self.turn = BLACK
+            self.incremental_zobrist_hash ^= self.zobrist_array[ZOBRIST_TURN_INDEX]
 
         # Set the pieces in hand
-        self.pieces_in_hand = [collections.Counter(), collections.Counter()]
         if parts[2] != "-":
             piece_count = 0
             for c in parts[2]:
@@ -1373,6 +2475,8 @@ class Board(object):
                     piece_count += int(c)
                 else:
                     piece = Piece.from_symbol(c)
+                    if piece.piece_type >= KING:
+                        raise ValueError("invalid piece in pieces in hand part of sfen: {0}".format(repr(sfen)))
                     if piece_count == 0:
                         piece_count = 1
                     self.add_piece_into_hand(piece.piece_type, piece.color, piece_count)
@@ -1382,7 +2486,7 @@ class Board(object):
         self.move_number = int(parts[3]) or 1
 
         # Reset the transposition table.
-        self.transpositions = collections.Counter((self.zobrist_hash(),))
+        self.hash_history = [self.zobrist_hash()]
 
     def push_usi(self, usi):
         """
@@ -1470,12 +2574,15 @@ class Board(object):
             else:
                 builder.append(" ")
 
-        if len(self.pieces_in_hand[BLACK]) + len(self.pieces_in_hand[WHITE]) > 0:
+        if any(self.pieces_in_hand[BLACK]) or any(self.pieces_in_hand[WHITE]):
             builder.append("\n\n")
 
             # pieces in hand
             for color in COLORS:
-                for piece_type, piece_count in self.pieces_in_hand[color].items():
+                for piece_type in HAND_PIECE_TYPES:
+                    piece_count = self.pieces_in_hand[color][piece_type]
+                    if not piece_count:
+                        continue
                     builder.append(" ")
                     piece = Piece(piece_type, color)
                     builder.append(piece.symbol())
@@ -1504,57 +2611,159 @@ class Board(object):
 
         return False
 
-    def zobrist_hash(self, array=None):
+    def copy(self, stack=True):
         """
-        Returns a Zobrist hash of the current position.
+        Creates a copy of the board. The move stack is copied if `stack` is
+        `True`, left empty if it is `False`, or only the last `stack` moves
+        are copied if it is a number. Immutable tables are shared.
         """
-        # Hash in the board setup.
-        zobrist_hash = self.board_zobrist_hash(array)
+        board = type(self).__new__(type(self))
+        board.pseudo_legal_moves = PseudoLegalMoveGenerator(board)
+        board.legal_moves = LegalMoveGenerator(board)
+
+        board.piece_bb = self.piece_bb[:]
+        board.pieces_in_hand = [self.pieces_in_hand[BLACK][:], self.pieces_in_hand[WHITE][:]]
+        board.occupied = self.occupied.copy()
+        board.king_squares = self.king_squares[:]
+        board.pieces = self.pieces[:]
+        board.turn = self.turn
+        board.move_number = self.move_number
+        board.check_state = self.check_state
+        board.sfen_ranks = self.sfen_ranks[:]
+        board.zobrist_array = self.zobrist_array
+        board.incremental_zobrist_hash = self.incremental_zobrist_hash
+
+        if stack is True:
+            board.stack = self.stack[:]
+        elif stack is False or stack <= 0:
+            board.stack = []
+        else:
+            board.stack = self.stack[-stack:]
+        board.hash_history = self.hash_history[len(self.stack) - len(board.stack) :]
+
+        return board
 
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getstate__(self):
+        if self.zobrist_array is DEFAULT_RANDOM_ARRAY:
+            zobrist_array = None
+        elif self.zobrist_array is WIDE_RANDOM_ARRAY:
+            zobrist_array = "wide"
+        else:
+            zobrist_array = self.zobrist_array
+
+        return (
+            self.piece_bb,
+            self.occupied[BLACK],
+            self.occupied[WHITE],
+            self.pieces_in_hand,
+            self.king_squares,
+            self.pieces,
+            self.turn,
+            self.move_number,
+            # Moves are packed, with moves pushed as packed moves stored as
+            # negative numbers to restore them the same way.
+            [
+                (-1 - int(move) if isinstance(move, numbers.Integral) else move.packed(), captured_piece_type)
+                for move, captured_piece_type, check_state in self.stack
+            ],
+            zobrist_array,
+            self.incremental_zobrist_hash,
+            self.hash_history,
+        )
+
+    def __setstate__(self, state):
+        (
+            self.piece_bb,
+            occupied_by_black,
+            occupied_by_white,
+            self.pieces_in_hand,
+            self.king_squares,
+            self.pieces,
+            self.turn,
+            self.move_number,
+            stack,
+            zobrist_array,
+            self.incremental_zobrist_hash,
+            self.hash_history,
+        ) = state
+
+        if zobrist_array is None:
+            zobrist_array = DEFAULT_RANDOM_ARRAY
+        elif zobrist_array == "wide":
+            zobrist_array = WIDE_RANDOM_ARRAY
+
+        self.pseudo_legal_moves = PseudoLegalMoveGenerator(self)
+        self.legal_moves = LegalMoveGenerator(self)
+        self.occupied = self.occupied_class(occupied_by_black, occupied_by_white)
+        self.stack = [
+            (-1 - move if move < 0 else Move.from_packed(move), captured_piece_type, None)
+            for move, captured_piece_type in stack
+        ]
+        self.check_state = None
+        self.sfen_ranks = [None] * 9
+        self.zobrist_array = zobrist_array
+
+    def zobrist_hash(self, array=None):
+        """
+        Returns a Zobrist hash of the current position, using the keys of
+        `array` if given. Custom arrays need `ZOBRIST_ARRAY_SIZE` keys,
+        otherwise `ValueError` is raised.
+        """
         if array is None:
-            array = DEFAULT_RANDOM_ARRAY
+            return self.incremental_zobrist_hash
+
+        check_zobrist_array(array)
+
+        zobrist_hash = self.board_zobrist_hash(array) ^ self.hand_zobrist_hash(array)
 
         if self.turn == WHITE:
-            zobrist_hash ^= array[2268]
-
-        # pieces in hand pattern is
-        # 19 * 5 * 5 * 5 * 5 * 3 * 3 = 106875 < pow(2, 17)
-        # just checking black side is okay in normal state
-        i = (
-            self.pieces_in_hand[BLACK][ROOK] * 35625
-            + self.pieces_in_hand[BLACK][BISHOP] * 11875
-            + self.pieces_in_hand[BLACK][GOLD] * 2375
-            + self.pieces_in_hand[BLACK][SILVER] * 475
-            + self.pieces_in_hand[BLACK][KNIGHT] * 95
-            + self.pieces_in_hand[BLACK][LANCE] * 19
-            + self.pieces_in_hand[BLACK][PAWN]
-        )
-        bit = bit_scan(i)
-        while bit != -1 and bit is not None:
-            zobrist_hash ^= array[2269 + bit]
-            bit = bit_scan(i, bit + 1)
+            zobrist_hash ^= array[ZOBRIST_TURN_INDEX]
 
         return zobrist_hash
 
     def board_zobrist_hash(self, array=None):
+        """
+        Returns a Zobrist hash of the pieces on the board.
+        """
         if array is None:
-            return self.incremental_zobrist_hash
+            array = self.zobrist_array
 
         zobrist_hash = 0
 
         squares = self.occupied[BLACK]
-        square = bit_scan(squares)
-        while square != -1 and square is not None:
+        for square in scan_forward(squares):
             piece_index = (self.piece_type_at(square) - 1) * 2
             zobrist_hash ^= array[81 * piece_index + 9 * rank_index(square) + file_index(square)]
-            square = bit_scan(squares, square + 1)
 
         squares = self.occupied[WHITE]
-        square = bit_scan(squares)
-        while square != -1 and square is not None:
+        for square in scan_forward(squares):
             piece_index = (self.piece_type_at(square) - 1) * 2 + 1
             zobrist_hash ^= array[81 * piece_index + 9 * rank_index(square) + file_index(square)]
-            square = bit_scan(squares, square + 1)
+
+        return zobrist_hash
+
+    def hand_zobrist_hash(self, array=None):
+        """
+        Returns a Zobrist hash of the pieces in hand of both sides. Custom
+        arrays need `ZOBRIST_ARRAY_SIZE` keys, otherwise `ValueError` is
+        raised.
+        """
+        if array is None:
+            array = self.zobrist_array
+        check_zobrist_array(array)
+
+        zobrist_hash = 0
+
+        for color in COLORS:
+            for piece_type in HAND_PIECE_TYPES:
+                for count in range(1, self.pieces_in_hand[color][piece_type] + 1):
+                    zobrist_hash ^= array[zobrist_hand_index(color, piece_type, count)]
 
         return zobrist_hash
 
@@ -1572,9 +2781,8 @@ class PseudoLegalMoveGenerator(object):
 
     __nonzero__ = __bool__
 
-    # TODO: Counting without generating actual moves
     def __len__(self):
-        return sum(1 for _ in self)
+        return self.board.count_pseudo_legal_moves()
 
     def __iter__(self):
         return self.board.generate_pseudo_legal_moves()
@@ -1597,12 +2805,7 @@ class LegalMoveGenerator(object):
     __nonzero__ = __bool__
 
     def __len__(self):
-        count = 0
-
-        for move in self.board.generate_legal_moves():
-            count += 1
-
-        return count
+        return self.board.count_legal_moves()
 
     def __iter__(self):
         return self.board.generate_legal_moves()
@@ -1636,10 +2839,7 @@ class SquareSet(object):
         return pop_count(self.mask)
 
     def __iter__(self):
-        square = bit_scan(self.mask)
-        while square != -1 and square is not None:
-            yield square
-            square = bit_scan(self.mask, square + 1)
+        return scan_forward(self.mask)
 
     def __contains__(self, square):
         return bool(BB_SQUARES[square] & self.mask)
@@ -1738,17 +2938,88 @@ class SquareSet(object):
         return self.mask
 
 
-# 81 * (14 piece types * (white or black) - 1) + 9 * (ranks - 1) + (files - 1) + ((white or black) - 1) + (current turn) + log2((19 pawn in hand) * (5 lance in hand) * (5 knight in hand) * (5 silver in hand) * (5 gold in hand) * (3 bishop) * (3 rook))
-#  = 2268 + 1 + 17 = 2286
+def write_packed_positions(f, positions):
+    """
+    Writes boards or positions already packed by `Board.to_packed()` to a
+    binary file as consecutive records of `PACKED_POSITION_SIZE` bytes.
+    Returns the number of records written.
+    """
+    count = 0
+    for position in positions:
+        if isinstance(position, Board):
+            position = position.to_packed()
+        elif len(position) != PACKED_POSITION_SIZE:
+            raise ValueError("expected {0} bytes of a packed position".format(PACKED_POSITION_SIZE))
+        f.write(position)
+        count += 1
+    return count
+
+
+def read_packed_positions(f):
+    """
+    Yields the records of a binary file written by `write_packed_positions()`
+    as memoryviews of a memory map of the file, without copying them.
+    Pass a record to `Board.from_packed()` to get the position.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if size % PACKED_POSITION_SIZE:
+        raise ValueError("file size is not a multiple of {0}".format(PACKED_POSITION_SIZE))
+    if not size:
+        return
+
+    # The map is closed when no record refers to it anymore.
+    view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    for offset in range(0, size, PACKED_POSITION_SIZE):
+        yield view[offset : offset + PACKED_POSITION_SIZE]
+
+
+class ZobristSet(object):
+    """
+    A set of positions keyed by their Zobrist hashes, for example to
+    deduplicate positions. In debug mode it also keeps the positions to
+    count collisions, i.e. different positions with the same hash.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.hashes = {} if debug else set()
+        self.collisions = 0
+
+    def add(self, board):
+        """
+        Adds the position of the board. Returns `True` if its hash was not in
+        the set yet.
+        """
+        zobrist_hash = board.zobrist_hash()
+
+        if not self.debug:
+            if zobrist_hash in self.hashes:
+                return False
+            self.hashes.add(zobrist_hash)
+            return True
+
+        position = board.sfen().rsplit(" ", 1)[0]
+        previous = self.hashes.setdefault(zobrist_hash, position)
+        if previous is position:
+            return True
+        if previous != position:
+            self.collisions += 1
+        return False
+
+    def __contains__(self, board):
+        return board.zobrist_hash() in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+# 81 * (14 piece types * (white or black) - 1) + 9 * (ranks - 1) + (files - 1) + ((white or black) - 1) + (current turn) + 2 * (18 pawns + 4 lances + 4 knights + 4 silvers + 4 golds + 2 bishops + 2 rooks in hand)
+#  = 2268 + 1 + 76 = 2345
 #
 # Genetation code example:
 # import random
-# for i in range(2286):
-#     if i % 4 == 0:
-#         print '    ',
-#     print '0x{0:016X},'.format(random.randint(0, 0xffffffffffffffffL)),
-#     if i % 4 == 3:
-#         print ''
+# for i in range(2345):
+#     print('    0x{0:016X},'.format(random.randint(0, 0xFFFFFFFFFFFFFFFF)))
 
 DEFAULT_RANDOM_ARRAY = [
     0xA00BA23D355457E0,
@@ -4037,4 +5308,70 @@ DEFAULT_RANDOM_ARRAY = [
     0x41EBFBF5687571E8,
     0x86D6113C636B6F29,
     0x4C532A8DB8D2B468,
+    0x2577212E253C90A5,
+    0x18A4F47EB4E671DA,
+    0x10FE995944145FBC,
+    0x1FF89D4F32E99041,
+    0x20C8B69D8191222E,
+    0x63DF2E78503B0A2C,
+    0xF6CD737727E6BA44,
+    0x50BAE39B6F6DC18C,
+    0xD0D02B408F61FA98,
+    0x79889EA8DFC3D83E,
+    0x3CA9228B96820740,
+    0x458A1CB73211D4AC,
+    0x70E9EA05810E7402,
+    0x20F55761384F73A7,
+    0x88177C71676A4570,
+    0xE1DFB94102A6E66D,
+    0x6F44997B0B3BE488,
+    0xBFEAB336F5306EB1,
+    0x85E8A41D6430DBE6,
+    0x74DEFC6295364B13,
+    0x732F891785D7AE75,
+    0x8FB26EDC3181A482,
+    0x71FDF2C4BBC96FAA,
+    0x29AB3321941EE0B0,
+    0xAC7020E609E58013,
+    0x4EBB4B197AE3686C,
+    0xD7E6C5AF42366856,
+    0x91EB6FA1DE97950F,
+    0x130939848A346A53,
+    0x07D4DF94C38E34EE,
+    0x6C3B3C2B9090E2B2,
+    0xCFD198BBDC50DD0B,
+    0x06B18C9C35C646AC,
+    0x52A9CAD9C89CF2AC,
+    0x18CF658246012B99,
+    0x60F85A4E1F851EE8,
+    0xC43936FDB77D8E40,
+    0xFC82E433B3491251,
+    0xCD488083D2CF52E0,
+    0xE3C43F10208E817F,
+    0xC528AA89A3B84676,
+    0x02C58CC4284934EA,
+    0xEAB02E3FE509AE83,
+    0x7D52562C08B6960F,
+    0x474A3F2DFCCF8942,
+    0xAE30C69D402AB0DE,
+    0x8B4979F406AC20B1,
+    0x0BC2625E80F4E506,
+    0x88591C8A0E7FC4DF,
+    0x317C9EE1AC5D599F,
+    0x49A13C846435EFF1,
+    0x4B421E2D4CA70403,
+    0x6FDFC504EA41A664,
+    0xCD3A806DBB470FF5,
+    0x7BEA847A77C52D7A,
+    0xCA2C27CF9224B233,
+    0xDBABF68368D7E0FA,
+    0x296B1512D13DDC80,
+    0x06C695D6914631EA,
 ]
+
+
+# The keys of DEFAULT_RANDOM_ARRAY with 64 more bits from a fixed seed, for
+# 128-bit Zobrist hashes. The lower and upper 64 bits are independent hashes.
+zobrist_random = random.Random(0)
+WIDE_RANDOM_ARRAY = [key | zobrist_random.getrandbits(64) << 64 for key in DEFAULT_RANDOM_ARRAY]
+del zobrist_random
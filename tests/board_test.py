@@ -16,10 +16,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import copy
+import os
+import pickle
+import random
+import tempfile
 import unittest
 
+from mock import patch
+
 import shogi
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class BoardTestCase(unittest.TestCase):
     def test_default(self):
@@ -78,6 +91,31 @@ class BoardTestCase(unittest.TestCase):
         self.assertFalse(shogi.Move.from_usi("P*9h") in board.legal_moves)
         self.assertEqual(len(board.legal_moves), 65)
 
+    def test_drops(self):
+        board = shogi.Board("4k4/9/9/9/9/9/9/4P4/4K4 b RBGSNLP 1")
+        drops = collections.Counter(move.drop_piece_type for move in board.legal_moves if move.drop_piece_type)
+        self.assertEqual(drops[shogi.PAWN], 64)
+        self.assertEqual(drops[shogi.LANCE], 70)
+        self.assertEqual(drops[shogi.KNIGHT], 61)
+        for piece_type in [shogi.SILVER, shogi.GOLD, shogi.BISHOP, shogi.ROOK]:
+            self.assertEqual(drops[piece_type], 78)
+
+    def test_move_classes(self):
+        # discovered checks by the silver
+        board = shogi.Board("4k4/9/9/9/4S4/9/9/9/K3R4 b G 1")
+        checks = set(move.usi() for move in board.generate_checks())
+        self.assertEqual(checks, set(["5e4d", "5e6d", "5e4f", "5e6f", "G*5b", "G*4b", "G*6b", "G*4a", "G*6a"]))
+
+        board = shogi.Board("4k4/9/2p6/1P7/9/9/9/9/4K4 b - 1")
+        self.assertEqual([move.usi() for move in board.generate_captures()], [])
+        board.push_usi("8d8c")
+        board.push_usi("7c7d")
+        self.assertEqual([move.usi() for move in board.generate_promotions()], ["8c8b+"])
+        board.push_usi("8c8b")
+        board.push_usi("7d7e")
+        self.assertEqual(set(move.usi() for move in board.generate_promotions()), set(["8b8a+"]))
+        self.assertEqual(len(list(board.generate_non_captures())), len(board.legal_moves))
+
     def test_suicide(self):
         board = shogi.Board("1k7/9/1G7/9/9/9/9/9/9 w - 1")
         self.assertTrue(board.is_suicide_or_check_by_dropping_pawn(shogi.Move.from_usi("8a8b")))
@@ -118,6 +156,174 @@ class BoardTestCase(unittest.TestCase):
         self.assertFalse(board.is_suicide_or_check_by_dropping_pawn(shogi.Move.from_usi("P*9b")))
         self.assertEqual(len(board.legal_moves), 77)
 
+        # a pinned piece can not capture dropping pawn
+        board = shogi.Board("k8/1g7/NSB6/9/9/9/9/9/9 b P 1")
+        self.assertTrue(board.is_check_by_dropping_pawn(shogi.Move.from_usi("P*9b")))
+        self.assertFalse(shogi.Move.from_usi("P*9b") in board.legal_moves)
+        board = shogi.Board("k8/1g7/NS7/9/9/9/9/9/9 b P 1")
+        self.assertFalse(board.is_check_by_dropping_pawn(shogi.Move.from_usi("P*9b")))
+        self.assertTrue(shogi.Move.from_usi("P*9b") in board.legal_moves)
+
+    def test_pin(self):
+        board = shogi.Board("4r4/9/9/9/9/9/4S4/9/4K4 b - 1")
+        self.assertTrue(board.is_pinned(shogi.BLACK, shogi.G5))
+        self.assertFalse(board.is_pinned(shogi.BLACK, shogi.I5))
+        self.assertEqual(board.pinned_mask(shogi.BLACK), shogi.BB_G5)
+        self.assertEqual(board.pin_mask(shogi.BLACK, shogi.I5), shogi.BB_ALL)
+        self.assertTrue(shogi.A5 in board.pin(shogi.BLACK, shogi.G5))
+        self.assertFalse(shogi.I5 in board.pin(shogi.BLACK, shogi.G5))
+        self.assertTrue(shogi.Move.from_usi("5g5f") in board.legal_moves)
+        self.assertFalse(shogi.Move.from_usi("5g4f") in board.legal_moves)
+        self.assertEqual(len(board.legal_moves), 6)
+
+        # pinned by a lance
+        board = shogi.Board("k8/9/9/9/l8/9/R8/9/K8 b - 1")
+        self.assertTrue(board.is_pinned(shogi.BLACK, shogi.G9))
+        self.assertEqual(len(board.legal_moves), 6)
+
+        # a piece of the other side is not pinned
+        board = shogi.Board("4r4/9/9/9/9/9/4s4/9/4K4 b - 1")
+        self.assertEqual(board.pinned_mask(shogi.BLACK), shogi.BB_VOID)
+
+    def test_check_state(self):
+        board = shogi.Board("4k4/9/9/9/9/9/4S4/9/4K4 w r 1")
+        self.assertFalse(board.is_check())
+        board.push_usi("R*1a")
+        self.assertEqual(board.checker_mask(), shogi.BB_VOID)
+        self.assertEqual(board.pinned_mask(shogi.BLACK), shogi.BB_VOID)
+        self.assertEqual(board.pinned_mask(shogi.WHITE), shogi.BB_VOID)
+        board.pop()
+        board.push_usi("R*5b")
+        self.assertEqual(board.pinned_mask(shogi.BLACK), shogi.BB_G5)
+        board.push_usi("5g5f")
+        self.assertEqual(board.checker_mask(), shogi.BB_VOID)
+        board.pop()
+        self.assertEqual(board.pinned_mask(shogi.BLACK), shogi.BB_G5)
+
+        # the state is recomputed when the board is edited
+        board.remove_piece_at(shogi.G5)
+        self.assertTrue(board.is_check())
+        self.assertEqual(board.checker_mask(), shogi.BB_B5)
+        self.assertEqual(board.pinned_mask(shogi.BLACK), shogi.BB_VOID)
+
+    def test_evasions(self):
+        # interpositions by drops
+        board = shogi.Board("4k4/9/9/9/9/9/9/9/4K3r b RBGSNLP 1")
+        self.assertEqual(board.checkers(), shogi.BB_I1)
+        self.assertFalse(shogi.Move.from_usi("5i6i") in board.legal_moves)
+        self.assertTrue(shogi.Move.from_usi("P*3i") in board.legal_moves)
+        self.assertEqual(len(board.legal_moves), 24)
+        self.assertEqual(len(list(board.generate_evasions())), 24)
+
+        # double check
+        board = shogi.Board("4k4/9/9/9/9/9/5n3/9/4K3r b RBGSNLP 1")
+        self.assertEqual(len(board.checkers()), 2)
+        self.assertEqual(len(board.legal_moves), 3)
+
+        # capture of the checker by a pinned piece
+        board = shogi.Board("4r4/9/9/9/9/9/4S4/3s5/4K4 b - 1")
+        self.assertEqual(board.checkers(), shogi.BB_H6)
+        self.assertFalse(shogi.Move.from_usi("5g6h") in board.legal_moves)
+        self.assertTrue(shogi.Move.from_usi("5i6h") in board.legal_moves)
+
+    def test_packed_moves(self):
+        board = shogi.Board()
+        packed_moves = list(board.generate_legal_moves(packed=True))
+        self.assertEqual(packed_moves, [move.packed() for move in board.generate_legal_moves()])
+        self.assertTrue(shogi.Move.from_usi("7g7f").packed() in board.legal_moves)
+        self.assertFalse(shogi.Move.from_usi("7g7e").packed() in board.legal_moves)
+
+        board.push(shogi.Move.from_usi("7g7f").packed())
+        board.push(shogi.Move.from_usi("3c3d").packed())
+        board.push(shogi.Move.from_usi("8h2b+").packed())
+        board.push(shogi.Move.from_usi("3a2b").packed())
+        board.push(shogi.Move.from_usi("B*4e").packed())
+        self.assertEqual(board.sfen(), "lnsgkg1nl/1r5s1/pppppp1pp/6p2/5B3/2P6/PP1PPPPPP/7R1/LNSGKGSNL w b 6")
+        self.assertEqual(board.pop(), shogi.Move.from_usi("B*4e").packed())
+        for _ in range(4):
+            board.pop()
+        self.assertEqual(board, shogi.Board())
+
+    def test_pieces_in_hand(self):
+        board = shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b 2PR 1")
+        self.assertEqual(board.pieces_in_hand[shogi.BLACK][shogi.PAWN], 2)
+        self.assertEqual(board.pieces_in_hand[shogi.BLACK][shogi.ROOK], 1)
+        self.assertEqual(board.pieces_in_hand[shogi.WHITE], [0] * 8)
+        self.assertTrue(board.has_piece_in_hand(shogi.PROM_ROOK, shogi.BLACK))
+        self.assertFalse(board.has_piece_in_hand(shogi.GOLD, shogi.BLACK))
+
+        board.push_usi("R*5b")
+        board.push_usi("5a5b")
+        self.assertEqual(board.pieces_in_hand[shogi.BLACK][shogi.ROOK], 0)
+        self.assertEqual(board.pieces_in_hand[shogi.WHITE][shogi.ROOK], 1)
+        self.assertEqual(board.move_stack, [shogi.Move.from_usi("R*5b"), shogi.Move.from_usi("5a5b")])
+        self.assertEqual(board.captured_piece_stack, [shogi.NONE, shogi.ROOK])
+        self.assertEqual(board.sfen(), "9/4k4/9/9/9/9/9/9/4K4 b 2Pr 3")
+
+        board.pop()
+        board.pop()
+        self.assertEqual(board, shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b R2P 1"))
+
+        with self.assertRaises(ValueError):
+            shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b K 1")
+
+    def test_slider_attack_tables_cache(self):
+        tables = (
+            shogi.BB_RANK_ATTACKS,
+            shogi.BB_FILE_ATTACKS,
+            shogi.BB_LANCE_ATTACKS,
+            shogi.BB_R45_ATTACKS,
+            shogi.BB_L45_ATTACKS,
+        )
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with patch.dict(os.environ, {"PYTHON_SHOGI_CACHE_DIR": cache_dir}):
+                path = shogi.slider_attack_tables_cache_path()
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(shogi.load_slider_attack_tables(), tables)
+                self.assertTrue(os.path.exists(path))
+                self.assertEqual(shogi.load_slider_attack_tables(), tables)
+
+                # a broken cache is regenerated
+                with open(path, "wb") as f:
+                    f.write(b"broken")
+                self.assertEqual(shogi.load_slider_attack_tables(), tables)
+
+        with patch.dict(os.environ, {"PYTHON_SHOGI_CACHE_DIR": ""}):
+            self.assertIsNone(shogi.slider_attack_tables_cache_path())
+            self.assertEqual(shogi.load_slider_attack_tables(), tables)
+
+    def test_slider_attacks(self):
+        random.seed(81)
+        for i in range(100):
+            occupied = shogi.Occupied(random.getrandbits(81), shogi.BB_VOID)
+            rotated = shogi.RotatedOccupied(occupied[shogi.BLACK], shogi.BB_VOID)
+            for square in shogi.SQUARES:
+                for color in shogi.COLORS:
+                    self.assertEqual(occupied.lance_attacks(color, square), rotated.lance_attacks(color, square))
+                self.assertEqual(occupied.rook_attacks(square), rotated.rook_attacks(square))
+                self.assertEqual(occupied.bishop_attacks(square), rotated.bishop_attacks(square))
+
+    def test_attacker_mask(self):
+        board = shogi.Board("l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1")
+        for square in shogi.SQUARES:
+            for color in shogi.COLORS:
+                attackers = shogi.BB_VOID
+                for piece_type in shogi.PIECE_TYPES:
+                    attackers |= (
+                        shogi.Board.attacks_from(piece_type, square, board.occupied, color ^ 1)
+                        & board.piece_bb[piece_type]
+                    )
+                self.assertEqual(board.attacker_mask(color, square), attackers & board.occupied[color])
+
+    def test_scan_forward(self):
+        self.assertEqual(list(shogi.scan_forward(shogi.BB_VOID)), [])
+        self.assertEqual(list(shogi.scan_forward(shogi.BB_A9 | shogi.BB_E5 | shogi.BB_I1)), [0, 40, 80])
+        self.assertEqual(list(shogi.scan_forward(shogi.BB_ALL)), list(shogi.SQUARES))
+        self.assertEqual(list(shogi.SquareSet(shogi.BB_RANK_B)), list(range(9, 18)))
+        self.assertEqual(shogi.bit_scan(shogi.BB_E5 | shogi.BB_I1), 40)
+        self.assertEqual(shogi.bit_scan(shogi.BB_E5 | shogi.BB_I1, 41), 80)
+        self.assertEqual(shogi.pop_count(shogi.BB_ALL), 81)
+
     def test_lance_move(self):
         board = shogi.Board("9/9/9/9/4L4/9/9/9/9 b - 1")
         self.assertEqual(len(board.legal_moves), 6)
@@ -142,6 +348,35 @@ class BoardTestCase(unittest.TestCase):
         self.assertFalse(board.is_fourfold_repetition())
         board.push(shogi.Move.from_usi("6b8b"))
         self.assertTrue(board.is_fourfold_repetition())
+        self.assertIsNone(board.perpetual_check_color())
+
+    def test_perpetual_check(self):
+        board = shogi.Board("8k/9/6R2/9/9/9/9/9/K8 b - 1")
+        board.push_usi("3c1c")
+        for i in range(3):
+            self.assertIsNone(board.perpetual_check_color())
+            for move_str in ["1a2a", "1c2c", "2a1a", "2c1c"]:
+                board.push_usi(move_str)
+        self.assertTrue(board.is_fourfold_repetition())
+        self.assertEqual(board.repetition_start(), 1)
+        self.assertEqual(board.perpetual_check_color(), shogi.BLACK)
+        self.assertEqual(len(board.stack), 13)
+
+        board.pop()
+        self.assertFalse(board.is_fourfold_repetition())
+        self.assertIsNone(board.perpetual_check_color())
+
+        # The check flags come from the undo records where they are known.
+        board = shogi.Board("8k/9/6R2/9/9/9/9/9/K8 b - 1")
+        for move_str in ["3c1c", "1a2a", "1c2c"]:
+            board.push_usi(move_str)
+        board.is_check()
+        board.push_usi("2a1a")
+        stack = list(board.stack)
+        self.assertIsNotNone(stack[-1][2])
+        self.assertEqual(board.check_history(), [False, True, False, True, False])
+        self.assertEqual(board.check_history(2), [False, True, False])
+        self.assertEqual(board.stack, stack)
 
     def test_legal_moves_in(self):
         # https://github.com/gunyarakun/python-shogi/issues/3
@@ -186,6 +421,156 @@ class BoardTestCase(unittest.TestCase):
         board = shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b 9p2l2n2s2gbr9P2L2N2S2GBR 1")
         self.assertEqual(board.sfen(), "4k4/9/9/9/9/9/9/9/4K4 b RB2G2S2N2L9Prb2g2s2n2l9p 1")
 
+    def test_sfen_cache(self):
+        board = shogi.Board()
+        self.assertEqual(board.sfen(), shogi.STARTING_SFEN)
+        board.push_usi("7g7f")
+        board.push_usi("3c3d")
+        board.push_usi("8h2b+")
+        self.assertEqual(board.sfen(), "lnsgkgsnl/1r5+B1/pppppp1pp/6p2/9/2P6/PP1PPPPPP/7R1/LNSGKGSNL w B 4")
+        board.pop()
+        self.assertEqual(board.sfen(), "lnsgkgsnl/1r5b1/pppppp1pp/6p2/9/2P6/PP1PPPPPP/1B5R1/LNSGKGSNL b - 3")
+        board.remove_piece_at(shogi.A1)
+        board.set_piece_at(shogi.E5, shogi.Piece(shogi.PROM_ROOK, shogi.WHITE))
+        self.assertEqual(board.sfen(), "lnsgkgsn1/1r5b1/pppppp1pp/6p2/4+r4/2P6/PP1PPPPPP/1B5R1/LNSGKGSNL b - 3")
+        self.assertEqual(repr(board), "Board('{0}')".format(board.sfen()))
+
+    def test_packed(self):
+        board = shogi.Board()
+        for usi in ["7g7f", "3c3d", "8h2b+", "3a2b", "B*4e", "6c6d", "4e6c+"]:
+            board.push_usi(usi)
+            packed = board.to_packed()
+            self.assertEqual(len(packed), shogi.PACKED_POSITION_SIZE)
+            self.assertEqual(shogi.Board.from_packed(packed, board.move_number).sfen(), board.sfen())
+
+        with tempfile.TemporaryFile() as f:
+            self.assertEqual(shogi.write_packed_positions(f, [shogi.Board(), board, board.to_packed()]), 3)
+            f.flush()
+            records = [shogi.Board.from_packed(record, 8).sfen() for record in shogi.read_packed_positions(f)]
+        self.assertEqual(records, [shogi.STARTING_SFEN.replace(" 1", " 8"), board.sfen(), board.sfen()])
+
+        with self.assertRaises(ValueError):
+            shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b - 1").to_packed()
+        with self.assertRaises(ValueError):
+            shogi.Board.from_packed(b"\0" * 31)
+
+        # Invalid data does not change the board.
+        sfen = board.sfen()
+        for data in [b"\xff" * 32, bytes(range(32)), board.to_packed()[:31] + b"\xff"]:
+            with self.assertRaises(ValueError):
+                board.set_packed(data)
+            self.assertEqual(board.sfen(), sfen)
+            self.assertEqual(len(board.stack), 7)
+
+    def test_zobrist_hash(self):
+        board = shogi.Board()
+        for usi in ["7g7f", "3c3d", "8h2b+", "3a2b", "B*4e", "6c6d", "4e6c+", "5a6c"]:
+            board.push_usi(usi)
+            self.assertEqual(board.zobrist_hash(), board.zobrist_hash(shogi.DEFAULT_RANDOM_ARRAY))
+            self.assertEqual(board.zobrist_hash(), shogi.Board(board.sfen()).zobrist_hash())
+        while board.stack:
+            board.pop()
+        self.assertEqual(board.zobrist_hash(), shogi.Board().zobrist_hash())
+
+        # Pieces in hand of both sides and the side to move are hashed.
+        hashes = set(
+            shogi.Board(sfen).zobrist_hash()
+            for sfen in ["4k4/9/9/9/9/9/9/9/4K4 b P 1", "4k4/9/9/9/9/9/9/9/4K4 b p 1", "4k4/9/9/9/9/9/9/9/4K4 w P 1"]
+        )
+        self.assertEqual(len(hashes), 3)
+
+        # Custom arrays need keys for the pieces in hand of both sides.
+        board = shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b P 1")
+        with self.assertRaises(ValueError):
+            board.zobrist_hash(shogi.DEFAULT_RANDOM_ARRAY[:2286])
+        with self.assertRaises(ValueError):
+            shogi.Board(zobrist_array=shogi.DEFAULT_RANDOM_ARRAY[:2286])
+        self.assertEqual(board.zobrist_hash(list(shogi.DEFAULT_RANDOM_ARRAY)), board.zobrist_hash())
+
+    def test_wide_zobrist_hash(self):
+        board = shogi.Board()
+        wide_board = shogi.Board(zobrist_array=shogi.WIDE_RANDOM_ARRAY)
+        for usi in ["7g7f", "3c3d", "8h2b+", "3a2b", "B*4e"]:
+            board.push_usi(usi)
+            wide_board.push_usi(usi)
+            self.assertEqual(wide_board.zobrist_hash(), wide_board.zobrist_hash(shogi.WIDE_RANDOM_ARRAY))
+            self.assertEqual(wide_board.zobrist_hash() & 0xFFFFFFFFFFFFFFFF, board.zobrist_hash())
+            self.assertNotEqual(wide_board.zobrist_hash() >> 64, 0)
+
+    def test_zobrist_set(self):
+        # Only 16 different hashes to force collisions.
+        array = [key & 0xF for key in shogi.DEFAULT_RANDOM_ARRAY]
+        board = shogi.Board(zobrist_array=array)
+        positions = shogi.ZobristSet(debug=True)
+        self.assertTrue(positions.add(board))
+        self.assertFalse(positions.add(shogi.Board(zobrist_array=array)))
+        for move in board.legal_moves:
+            board.push(move)
+            positions.add(board)
+            board.pop()
+        self.assertEqual(positions.collisions, len(board.legal_moves) + 1 - len(positions))
+        self.assertIn(board, positions)
+
+    def test_copy(self):
+        board = shogi.Board()
+        sfens = [board.sfen()]
+        for usi in ["7g7f", "3c3d", "8h2b+", "3a2b"]:
+            board.push_usi(usi)
+            sfens.append(board.sfen())
+
+        for stack, moves in [(True, 4), (False, 0), (3, 3), (10, 4)]:
+            copied = board.copy(stack=stack)
+            self.assertEqual(copied, board)
+            self.assertEqual(copied.move_stack, board.move_stack[4 - moves :])
+            self.assertEqual(copied.zobrist_hash(), board.zobrist_hash())
+            copied.push_usi("B*4e")
+            self.assertNotEqual(copied, board)
+            self.assertEqual(len(board.stack), 4)
+            copied.pop()
+            for i in range(moves):
+                copied.pop()
+                self.assertEqual(copied.sfen(), sfens[3 - i])
+            self.assertEqual(copied.move_stack, [])
+
+        self.assertEqual(copy.deepcopy(board).sfen(), board.sfen())
+
+    def test_pickle(self):
+        board = shogi.Board(zobrist_array=shogi.WIDE_RANDOM_ARRAY)
+        for usi in ["7g7f", "3c3d", "8h2b+", "3a2b"]:
+            board.push_usi(usi)
+        board.push(shogi.Move.from_usi("B*4e").packed())
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            unpickled = pickle.loads(pickle.dumps(board, protocol))
+            self.assertEqual(unpickled, board)
+            self.assertEqual(unpickled.move_stack, board.move_stack)
+            self.assertIs(unpickled.zobrist_array, shogi.WIDE_RANDOM_ARRAY)
+            self.assertEqual(unpickled.zobrist_hash(), board.zobrist_hash())
+            self.assertEqual(set(unpickled.legal_moves), set(board.legal_moves))
+            while unpickled.stack:
+                unpickled.pop()
+            self.assertEqual(unpickled.sfen(), shogi.STARTING_SFEN)
+
+    def test_invalid_packed_moves(self):
+        board = shogi.Board("4k4/9/9/9/9/9/9/9/4K4 b RBGSNLP 1")
+        for move in [
+            127,
+            32767,
+            shogi.PACKED_MOVES,
+            -1,
+            shogi.pack_move(81, shogi.E5),
+            shogi.pack_move(shogi.I5, 81),
+            shogi.pack_move(None, shogi.E5, False, shogi.KING),
+            shogi.pack_move(None, shogi.E5, False, 46),
+            shogi.pack_move(None, shogi.E5, False, shogi.PAWN) | 1 << 14,
+        ]:
+            self.assertFalse(board.is_pseudo_legal(move))
+            self.assertFalse(board.is_legal(move))
+            self.assertNotIn(move, board.legal_moves)
+            self.assertNotIn(move, board.pseudo_legal_moves)
+        self.assertFalse(board.is_legal(shogi.Move(None, shogi.E5, False, 9)))
+        self.assertTrue(board.is_legal(shogi.pack_move(None, shogi.E5, False, shogi.ROOK)))
+
     def test_issue_6(self):
         # double pawn should be checked for their own pawn
         board = shogi.Board("lr7/3skgg1+B/2n2s1pp/p1p1ppP2/3p1np2/1PPPP4/PS1G1P2P/2GS3R1/LNK4NL w L2pb 58")
@@ -196,6 +581,57 @@ class BoardTestCase(unittest.TestCase):
         board = shogi.Board("lnsg1g1nl/3k3r1/pppp1s1pp/b3p1p2/2PP1p2B/P3P3P/1P3PPP1/1S3K1R1/LN1G1GSNL w - 1")
         self.assertEqual(len(board.legal_moves), 39)
 
+    def test_promotion(self):
+        board = shogi.Board("4k4/9/4G2P1/2S3N2/9/9/9/9/4K4 b L 1")
+        self.assertTrue(board.is_pseudo_legal(shogi.Move.from_usi("7d7c+")))
+        self.assertFalse(board.is_pseudo_legal(shogi.Move.from_usi("7d8e+")))
+        self.assertTrue(board.is_pseudo_legal(shogi.Move.from_usi("2c2b+")))
+        self.assertTrue(board.is_pseudo_legal(shogi.Move.from_usi("2c2b")))
+        self.assertFalse(board.is_pseudo_legal(shogi.Move.from_usi("5c5b+")))
+        self.assertTrue(board.is_pseudo_legal(shogi.Move.from_usi("3d2b+")))
+        self.assertFalse(board.is_pseudo_legal(shogi.Move.from_usi("3d2b")))
+        self.assertFalse(board.is_pseudo_legal(shogi.Move.from_usi("L*1a")))
+        self.assertTrue(board.is_pseudo_legal(shogi.Move.from_usi("L*1b")))
+
+    def test_filter_legal(self):
+        board = shogi.Board("ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42")
+        moves = [shogi.Move.from_usi(usi) for usi in ["P*3e", "P*3d", "P*9e", "3c4d", "3c1a", "2g5d+", "2g3h+"]]
+        moves.append(shogi.Move.from_usi("8b7a").packed())
+        legal = [move for move in moves if board.is_legal(move)]
+        self.assertEqual(board.filter_legal(moves), legal)
+        self.assertEqual(len(legal), 5)
+        self.assertEqual(board.filter_legal_mask(moves), [board.is_legal(move) for move in moves])
+
+        flags = board.legal_move_flags()
+        self.assertEqual(sum(flags), len(board.legal_moves))
+        for move in board.legal_moves:
+            self.assertEqual(flags[move.packed()], 1)
+
+    @unittest.skipIf(numpy is None, "requires NumPy")
+    def test_filter_legal_numpy(self):
+        board = shogi.Board("ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42")
+        moves = [shogi.Move.from_usi(usi).packed() for usi in ["P*3e", "P*3d", "3c4d", "2g5d+", "8b7a"]]
+        candidates = numpy.array(moves, dtype=numpy.int64)
+        legal = [move for move in moves if board.is_legal(move)]
+        self.assertEqual(board.filter_legal(candidates), legal)
+        self.assertEqual(board.filter_legal_mask(candidates), [board.is_legal(move) for move in moves])
+        self.assertEqual([board.is_legal(move) for move in candidates], board.filter_legal_mask(moves))
+        self.assertFalse(board.is_legal(numpy.int64(32767)))
+
+    def test_legal_move_mask(self):
+        for sfen in [
+            shogi.STARTING_SFEN,
+            "ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42",
+            "4k4/9/9/9/9/9/9/9/4K3r b RBGSNLP 1",
+        ]:
+            board = shogi.Board(sfen)
+            indices = [index for index, flag in enumerate(board.legal_move_mask()) if flag]
+            self.assertEqual(indices, sorted(move.index() for move in board.legal_moves))
+
+            out = bytearray(b"\x01" * shogi.MOVE_INDICES)
+            self.assertIs(board.legal_move_mask(out), out)
+            self.assertEqual(sum(out), len(indices))
+
     def test_issue_9(self):
         self.assertEqual(bool(shogi.Move.null()), False)
         board = shogi.Board()
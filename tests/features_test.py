@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import shogi
+
+try:
+    import numpy
+
+    import shogi.Features
+except ImportError:
+    numpy = None
+
+SFENS = [
+    shogi.STARTING_SFEN,
+    "ln1g3+Rl/1ks4s1/pp1gppbpp/2p3N2/9/5P1P1/PPPP1S1bP/2K1R1G2/LNSG3NL w 4p 42",
+    "l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1",
+]
+
+
+@unittest.skipIf(numpy is None, "requires NumPy")
+class FeaturesTestCase(unittest.TestCase):
+    def assert_features(self, board, planes, attacks):
+        self.assertEqual(planes.shape, (shogi.Features.feature_planes(attacks), 9, 9))
+        for square in shogi.SQUARES:
+            rank, file = divmod(square, 9)
+            piece = board.piece_at(square)
+            for color in shogi.COLORS:
+                for i, piece_type in enumerate(shogi.PIECE_TYPES):
+                    expected = piece is not None and piece.color == color and piece.piece_type == piece_type
+                    self.assertEqual(planes[color * len(shogi.PIECE_TYPES) + i, rank, file], expected)
+                if attacks:
+                    self.assertEqual(
+                        planes[shogi.Features.FEATURE_PLANES + color, rank, file],
+                        board.is_attacked_by(color, square),
+                    )
+        for color in shogi.COLORS:
+            for i, piece_type in enumerate(shogi.HAND_PIECE_TYPES):
+                plane = planes[shogi.Features.PIECE_PLANES + color * len(shogi.HAND_PIECE_TYPES) + i]
+                self.assertTrue((plane == board.pieces_in_hand[color][piece_type]).all())
+        self.assertTrue((planes[shogi.Features.TURN_PLANE] == board.turn).all())
+
+    def test_features(self):
+        for sfen in SFENS:
+            board = shogi.Board(sfen)
+            self.assert_features(board, shogi.Features.features(board), False)
+            self.assert_features(board, shogi.Features.features(board, attacks=True), True)
+
+    def test_batch_features(self):
+        boards = [shogi.Board(sfen) for sfen in SFENS]
+        out = numpy.zeros((len(SFENS), shogi.Features.feature_planes(True), 9, 9), dtype=numpy.uint8)
+        self.assertIs(shogi.Features.write_batch_features(SFENS, out, attacks=True), out)
+        for board, planes in zip(boards, out):
+            self.assert_features(board, planes, True)
+
+        planes = shogi.Features.write_batch_features(boards)
+        self.assertEqual(planes.shape, (len(SFENS), shogi.Features.FEATURE_PLANES, 9, 9))
+        self.assertTrue((planes == out[:, : shogi.Features.FEATURE_PLANES]).all())
+
+    def test_decode_sfens(self):
+        decoded = shogi.Features.decode_sfens(SFENS)
+        self.assertEqual(decoded.pieces.shape, (len(SFENS), 81))
+        self.assertEqual(list(decoded.turns), [shogi.BLACK, shogi.WHITE, shogi.BLACK])
+        self.assertEqual(list(decoded.move_numbers), [1, 42, 1])
+        planes = shogi.Features.write_decoded_features(decoded)
+        self.assertTrue((planes == shogi.Features.write_batch_features(SFENS)).all())
+
+        decoded_in_parallel = shogi.Features.decode_sfens(iter(SFENS * 3), processes=2, chunk_size=2)
+        for array, expected in zip(decoded_in_parallel, decoded):
+            self.assertTrue((array == numpy.concatenate([expected] * 3)).all())
+
+        for sfen in [
+            "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSN b - 1",
+            "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSN+G b - 1",
+            "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL x - 1",
+            "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b 2K 1",
+        ]:
+            with self.assertRaises(ValueError):
+                shogi.Features.decode_sfens([sfen])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -884,11 +884,44 @@ TEST_KIF_81DOJO_RESULT = {
 
 TEST_KIF_CUSTOM_BOARD_RESULT = {
     "names": ["大内延介", "最新詰将棋２００選"],
-    "sfen": "8l/4R+B2k/7p1/6s2/9/9/9/9/9 w 1r1b4g3s4n3l17p 1",
+    "sfen": "8l/4R+B2k/7p1/6s2/9/9/9/9/9 b 1r1b4g3s4n3l17p 1",
     "moves": ["4b3a"],
     "win": "-",
 }
 
+TEST_KIF_PERPETUAL_CHECK = """手合割：平手
+後手の持駒：なし
+  ９ ８ ７ ６ ５ ４ ３ ２ １
++---------------------------+
+| ・ ・ ・ ・ ・ ・ ・ ・v玉|一
+| ・ ・ ・ ・ ・ ・ ・ ・ ・|二
+| ・ ・ ・ ・ ・ ・ 飛 ・ ・|三
+| ・ ・ ・ ・ ・ ・ ・ ・ ・|四
+| ・ ・ ・ ・ ・ ・ ・ ・ ・|五
+| ・ ・ ・ ・ ・ ・ ・ ・ ・|六
+| ・ ・ ・ ・ ・ ・ ・ ・ ・|七
+| ・ ・ ・ ・ ・ ・ ・ ・ ・|八
+| 玉 ・ ・ ・ ・ ・ ・ ・ ・|九
++---------------------------+
+先手の持駒：なし
+手数----指手---------消費時間--
+   1 １三飛(33)
+   2 ２一玉(11)
+   3 ２三飛(13)
+   4 １一玉(21)
+   5 １三飛(23)
+   6 ２一玉(11)
+   7 ２三飛(13)
+   8 １一玉(21)
+   9 １三飛(23)
+  10 ２一玉(11)
+  11 ２三飛(13)
+  12 １一玉(21)
+  13 １三飛(23)
+  14 千日手
+まで13手で千日手
+"""
+
 
 class ParserTest(unittest.TestCase):
     def test_parse_str(self):
@@ -903,6 +936,16 @@ class ParserTest(unittest.TestCase):
         result = KIF.Parser.parse_str(TEST_KIF_81DOJO)
         self.assertEqual(result[0], TEST_KIF_81DOJO_RESULT)
 
+    def test_parse_str_perpetual_check(self):
+        result = KIF.Parser.parse_str(TEST_KIF_PERPETUAL_CHECK)
+        self.assertEqual(result[0]["sfen"], "8k/9/6R2/9/9/9/9/9/K8 b - 1")
+        self.assertEqual(len(result[0]["moves"]), 13)
+        self.assertEqual(result[0]["win"], "w")
+
+        # Without the last check it is a draw.
+        result = KIF.Parser.parse_str(TEST_KIF_PERPETUAL_CHECK.replace("  13 １三飛(23)\n", ""))
+        self.assertEqual(result[0]["win"], "-")
+
     def test_parse_file(self):
         try:
             tempdir = tempfile.mkdtemp()
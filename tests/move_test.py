@@ -26,6 +26,26 @@ class MoveTestCase(unittest.TestCase):
         move = shogi.Move.from_usi("9a9b")
         self.assertEqual(move.__hash__(), 9)
 
+    def test_packed(self):
+        for usi in ["9a9b", "1i1a+", "P*5e", "R*1a", "0000"]:
+            move = shogi.Move.from_usi(usi)
+            self.assertEqual(shogi.Move.from_packed(move.packed()), move)
+            self.assertEqual(shogi.unpack_move(move.packed()), shogi.unpack_move(move))
+        self.assertEqual(shogi.Move.null().packed(), shogi.PACKED_NULL_MOVE)
+        self.assertEqual(shogi.pack_move(shogi.A9, shogi.B9), 9)
+
+    def test_index(self):
+        indices = set()
+        for usi in ["9a9b", "9a9b+", "1i1a+", "P*5e", "R*1a", "R*1i"]:
+            move = shogi.Move.from_usi(usi)
+            self.assertEqual(shogi.Move.from_index(move.index()), move)
+            self.assertTrue(0 <= move.index() < shogi.MOVE_INDICES)
+            indices.add(move.index())
+        self.assertEqual(len(indices), 6)
+        self.assertEqual(shogi.Move.from_usi("R*1i").index(), shogi.MOVE_INDICES - 2)
+        with self.assertRaises(ValueError):
+            shogi.Move.null().index()
+
 
 if __name__ == "__main__":
     unittest.main()
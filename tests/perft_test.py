@@ -74,6 +74,36 @@ class PerftTestCase(unittest.TestCase):
         board = shogi.Board("l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1")
         self.assertEqual(perft(board, 1), 1)
 
+    def test_board_perft(self):
+        board = shogi.Board()
+        self.assertEqual(board.perft(1), 30)
+        self.assertEqual(board.perft(2), 900)
+        self.assertEqual(board.perft(3), 25470)
+        self.assertEqual(board, shogi.Board())
+
+        for sfen in [
+            "4k4/9/9/9/9/9/9/9/9 b 16P 1",
+            "r7k/6K2/7SP/4s2bb/9/9/9/9/9 b r4g2s4n4l17p 1",
+            "l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1",
+        ]:
+            board = shogi.Board(sfen)
+            self.assertEqual(board.perft(2), perft(board, 2))
+
+    def test_rotated_occupied(self):
+        class RotatedBoard(shogi.Board):
+            occupied_class = shogi.RotatedOccupied
+
+        for sfen in [
+            shogi.STARTING_SFEN,
+            "l7l/5bS2/p1np5/6Sk1/4p2B1/PSpPPn1G1/1P1G2g1N/2+l6/L1KN1+r3 b R3Pgs7p 1",
+        ]:
+            self.assertEqual(RotatedBoard(sfen).perft(3), shogi.Board(sfen).perft(3))
+
+    def test_count_moves(self):
+        board = shogi.Board("R8/2K1S1SSk/4B4/9/9/9/9/9/1L1L1L3 b RBGSNLP3g3n17p 1")
+        self.assertEqual(board.count_legal_moves(), len(list(board.legal_moves)))
+        self.assertEqual(board.count_pseudo_legal_moves(), len(list(board.pseudo_legal_moves)))
+
 
 if __name__ == "__main__":
     unittest.main()
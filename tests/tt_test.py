@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the python-shogi library.
+# Copyright (C) 2015- Tasuku SUENAGA <tasuku-s-github@titech.ac>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import shogi
+import shogi.TT
+
+
+class TranspositionTableTestCase(unittest.TestCase):
+    def test_probe_and_store(self):
+        board = shogi.Board()
+        table = shogi.TT.TranspositionTable.from_megabytes(1)
+        self.assertEqual(len(table), 1024 * 1024 // shogi.TT.ENTRY_SIZE)
+        self.assertIsNone(table.probe(board.zobrist_hash()))
+
+        move = shogi.Move.from_usi("7g7f")
+        table.store(board.zobrist_hash(), move, -120, 6, shogi.TT.BOUND_LOWER)
+        entry = table.probe(board.zobrist_hash())
+        self.assertEqual(entry, (move.packed(), -120, 6, shogi.TT.BOUND_LOWER, 0))
+        self.assertEqual(shogi.Move.from_packed(entry.move), move)
+        board.push(entry.move)
+        self.assertIsNone(table.probe(board.zobrist_hash()))
+        board.pop()
+
+        # Storing the same position without a move keeps the move.
+        table.store(board.zobrist_hash(), None, 30, 7, shogi.TT.BOUND_EXACT)
+        self.assertEqual(table.probe(board.zobrist_hash()), (move.packed(), 30, 7, shogi.TT.BOUND_EXACT, 0))
+
+        self.assertEqual((table.hits, table.misses, table.overwrites), (2, 2, 0))
+        with self.assertRaises(ValueError):
+            table.store(board.zobrist_hash(), move, 40000, 1, shogi.TT.BOUND_EXACT)
+        with self.assertRaises(ValueError):
+            table.store(board.zobrist_hash(), move, 0, 3, 4)
+        table.clear()
+        self.assertIsNone(table.probe(board.zobrist_hash()))
+
+    def test_replacement(self):
+        # A single bucket of a deep and an always replaced entry.
+        table = shogi.TT.TranspositionTable(2)
+        keys = [i << 48 for i in range(1, 5)]
+        table.store(keys[0], None, 0, 10, shogi.TT.BOUND_EXACT)
+        table.store(keys[1], None, 0, 3, shogi.TT.BOUND_EXACT)
+        table.store(keys[2], None, 0, 2, shogi.TT.BOUND_EXACT)
+        self.assertEqual(table.overwrites, 1)
+        self.assertEqual(table.probe(keys[0]).depth, 10)
+        self.assertIsNone(table.probe(keys[1]))
+        self.assertEqual(table.probe(keys[2]).depth, 2)
+
+        # A shallower search of the same position goes to the second entry.
+        table.store(keys[0], None, 0, 1, shogi.TT.BOUND_UPPER)
+        self.assertEqual(table.probe(keys[0]), (0, 0, 10, shogi.TT.BOUND_EXACT, 0))
+        self.assertIsNone(table.probe(keys[2]))
+        self.assertEqual(table.overwrites, 2)
+        table.store(keys[2], None, 0, 2, shogi.TT.BOUND_EXACT)
+        table.store(keys[0], None, 5, 1, shogi.TT.BOUND_EXACT)
+        self.assertEqual(table.probe(keys[0]), (0, 5, 1, shogi.TT.BOUND_EXACT, 0))
+
+        # Entries of older searches are replaced first.
+        table.new_search()
+        self.assertEqual(table.hashfull(), 0)
+        table.store(keys[3], None, 0, 1, shogi.TT.BOUND_UPPER)
+        self.assertEqual(table.probe(keys[3]).generation, 1)
+        self.assertIsNone(table.probe(keys[0]))
+        self.assertEqual(table.probe(keys[2]).generation, 1)
+        self.assertEqual(table.hashfull(), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()